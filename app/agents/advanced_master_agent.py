@@ -2,12 +2,26 @@
 Advanced Master Agent with sophisticated orchestration and state management
 """
 
-import json
+import re
+import time
 import uuid
+import string
+import array
+import asyncio
+import logging
+import functools
+from collections import OrderedDict, deque
 from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from typing import Optional, TYPE_CHECKING
 
+try:
+    import ahocorasick
+except ImportError:
+    # pyahocorasick not installed, fall back to substring scans
+    ahocorasick = None
+
 if TYPE_CHECKING:
     from app.services.agent_orchestrator import AgentOrchestrator, OrchestrationPattern
 
@@ -16,9 +30,216 @@ from app.agents.sales_agent import SalesAgent
 from app.agents.verification_agent import VerificationAgent
 from app.agents.underwriting_agent import UnderwritingAgent
 from app.models.schemas import ConversationContext, ChatResponse, ChatStage
-from app.database.database import get_db, ChatSession
+from app.database.database import get_db, ChatSession, Customer, ConversationHistoryEntry
 from app.services.conversation_state_manager import ConversationStateManager, StateTransition
 from app.services.pdf_service import PDFService
+from app.utils import serialization
+
+logger = logging.getLogger(__name__)
+
+
+# Position of each stage in the stage-transition counters
+STAGE_INDEX = {stage: index for index, stage in enumerate(ChatStage)}
+
+# Previous stage for backward navigation along the main flow
+PREVIOUS_STAGE = {
+    ChatStage.SALES: ChatStage.GREETING,
+    ChatStage.VERIFICATION: ChatStage.SALES,
+    ChatStage.UNDERWRITING: ChatStage.VERIFICATION,
+    ChatStage.APPROVED: ChatStage.UNDERWRITING
+}
+
+# Number of recent conversation patterns kept for analytics
+CONVERSATION_PATTERN_LIMIT = 100
+
+
+class MasterAgentMetrics:
+    """Process-wide conversation analytics shared by all advanced master agents"""
+    
+    __slots__ = (
+        "total_handled", "successful_completions", "escalations", "average_satisfaction",
+        "stage_transitions", "common_user_intents", "conversation_patterns"
+    )
+    
+    def __init__(self):
+        self.total_handled = 0
+        self.successful_completions = 0
+        self.escalations = 0
+        self.average_satisfaction = 0.0
+        self.stage_transitions = array.array('Q', [0] * len(ChatStage))  # indexed by STAGE_INDEX
+        self.common_user_intents: Optional[dict] = None  # created on first use
+        self.conversation_patterns: Optional[deque] = None  # last CONVERSATION_PATTERN_LIMIT patterns, created on first use
+    
+    def as_dict(self) -> dict:
+        """Analytics as a JSON-friendly dict"""
+        return {
+            "total_handled": self.total_handled,
+            "successful_completions": self.successful_completions,
+            "escalations": self.escalations,
+            "average_satisfaction": self.average_satisfaction,
+            "stage_transitions": {stage: self.stage_transitions[index] for stage, index in STAGE_INDEX.items()},
+            "common_user_intents": self.common_user_intents or {},
+            "conversation_patterns": list(self.conversation_patterns or ())
+        }
+
+
+METRICS = MasterAgentMetrics()
+
+# Greeting messages with personalization, shared by all instances
+GREETING_MESSAGES = (
+    "🙏 Namaste! Welcome to our AI-powered Personal Loan Assistant! I'm here to get you the best loan deal in minutes.",
+    "Welcome to QuickLoan Pro! 🎉 Your intelligent loan advisor is ready to help you secure instant approval.",
+    "Hello! I'm your advanced AI loan expert, powered by cutting-edge technology to make borrowing effortless.",
+    "Greetings! Ready for an intelligent loan experience? I'll guide you through our smart approval process."
+)
+
+# Trigger and keyword sets used for per-turn message analysis
+NEGOTIATION_TRIGGERS = frozenset({"rate", "offer", "better", "discount", "reduce", "match", "percent", "%"})
+DOCS_TRIGGERS = frozenset({"document", "documents", "salary slip", "salary slips", "self-employed", "no salary"})
+URGENCY_TRIGGERS = frozenset({"urgent", "immediate", "asap", "emergency"})
+COMPLEXITY_TRIGGERS = frozenset({"complex", "special", "different"})
+RATE_FOLLOWUP_TRIGGERS = frozenset({"rate", "offer", "better", "discount"})
+RATE_RESPONSE_KEYWORDS = frozenset({"rate", "offer", "best", "consider"})
+DOCS_FOLLOWUP_TRIGGERS = frozenset({"document", "salary slip", "self-employed", "no salary"})
+DOCS_RESPONSE_KEYWORDS = frozenset({"document", "alternative", "provide", "submit", "bank"})
+SANCTION_WORDS = frozenset({"email", "sanction", "letter", "yes"})
+DETAILS_WORDS = frozenset({"details", "show", "information", "summary"})
+
+LOAN_KEYWORDS = frozenset({"loan", "money", "borrow", "credit", "finance", "rupees", "lakh"})
+INFO_KEYWORDS = frozenset({"how", "what", "when", "where", "why", "explain", "tell me"})
+URGENT_KEYWORDS = frozenset({"urgent", "immediate", "asap", "quick", "fast", "now", "emergency"})
+PRICE_KEYWORDS = frozenset({"cheap", "affordable", "rate", "interest", "emi", "cost", "expensive"})
+TRUST_KEYWORDS = frozenset({"safe", "secure", "trust", "fraud", "scam", "legitimate", "real"})
+TECH_KEYWORDS = frozenset({"problem", "error", "not working", "issue", "help", "support"})
+COMPLEX_KEYWORDS = frozenset({"however", "but", "although", "specific", "detailed", "complex"})
+
+FRUSTRATED_WORDS = frozenset({"angry", "frustrated", "upset", "terrible", "awful", "waste"})
+EXCITED_WORDS = frozenset({"great", "awesome", "excellent", "wonderful", "excited", "yes!"})
+CONCERNED_WORDS = frozenset({"worried", "concerned", "safe", "secure", "trust", "fraud"})
+CONFUSED_WORDS = frozenset({"confused", "don't understand", "unclear", "explain"})
+
+# Emotional tone lexicons in priority order, matched against whole words
+EMOTIONAL_TONES = (
+    ("frustrated", FRUSTRATED_WORDS),
+    ("excited", EXCITED_WORDS),
+    ("concerned", CONCERNED_WORDS),
+    ("confused", CONFUSED_WORDS),
+)
+
+
+# Trigger categories resolved together in a single pass over the message
+TRIGGER_CATEGORIES = {
+    "neg": NEGOTIATION_TRIGGERS,
+    "doc": DOCS_TRIGGERS,
+    "urgent": URGENCY_TRIGGERS,
+    "complex": COMPLEXITY_TRIGGERS,
+    "rate_followup": RATE_FOLLOWUP_TRIGGERS,
+    "doc_followup": DOCS_FOLLOWUP_TRIGGERS,
+    "sanction": SANCTION_WORDS,
+    "details": DETAILS_WORDS,
+}
+
+
+def _build_trigger_automaton():
+    """Build an Aho-Corasick automaton mapping each trigger to its categories"""
+    if ahocorasick is None:
+        return None
+    
+    categories_by_trigger = {}
+    for category, triggers in TRIGGER_CATEGORIES.items():
+        for trigger in triggers:
+            categories_by_trigger.setdefault(trigger, []).append(category)
+    
+    automaton = ahocorasick.Automaton()
+    for trigger, categories in categories_by_trigger.items():
+        automaton.add_word(trigger, tuple(categories))
+    automaton.make_automaton()
+    return automaton
+
+
+TRIGGER_AUTOMATON = _build_trigger_automaton()
+
+
+def _match_triggers(msg_lower: str) -> frozenset:
+    """Return the trigger categories present in a lowercased message"""
+    if TRIGGER_AUTOMATON is not None:
+        return frozenset(
+            category
+            for _, categories in TRIGGER_AUTOMATON.iter(msg_lower)
+            for category in categories
+        )
+    return frozenset(
+        category for category, triggers in TRIGGER_CATEGORIES.items()
+        if any(t in msg_lower for t in triggers)
+    )
+
+
+# ConversationContext fields stored in the session snapshot
+SNAPSHOT_FIELDS = frozenset({
+    "session_id", "current_stage", "customer_phone", "loan_request",
+    "credit_score", "pre_approved_limit", "metadata"
+})
+
+# Maximum number of history entries kept in memory per conversation (all are persisted)
+CONVERSATION_HISTORY_LIMIT = 200
+
+# Personalization lookups cached per phone; entries are reloaded once they expire
+PERSONALIZATION_CACHE_SIZE = 1024
+PERSONALIZATION_CACHE_TTL = 300  # seconds before customer data is read from the database again
+
+# Strong references to in-flight persistence tasks so they aren't garbage collected
+_background_tasks: set = set()
+
+# session_id -> latest persistence task; each write waits for the one before it
+_state_writes: dict = {}
+
+# session_id -> history rows whose write failed, retried with the session's next write
+_unwritten_history: dict = {}
+
+
+def _forget_state_write(session_id: str, task: asyncio.Task):
+    """Drop a finished persistence task, and its session's chain entry if it was the latest"""
+    _background_tasks.discard(task)
+    if _state_writes.get(session_id) is task:
+        del _state_writes[session_id]
+
+
+# Indian mobile number, optionally prefixed with +91 or 091
+PHONE_PATTERN = re.compile(r'(?:\+91|091|\b)([6-9]\d{9})\b')
+
+
+@functools.lru_cache(maxsize=1024)
+def _emi(amount: float, tenure: int, monthly_rate_bp: int) -> float:
+    """EMI for an amount over a tenure (months) at a monthly rate given in basis points"""
+    monthly_rate = monthly_rate_bp / 10000
+    return (amount * monthly_rate) / (1 - (1 + monthly_rate) ** (-tenure))
+
+
+@functools.lru_cache(maxsize=4096)
+def _score_intents(msg_lower: str) -> dict:
+    """Score each intent as the fraction of its keywords present (cached per message)"""
+    tokens = _tokenize(msg_lower)
+    
+    return {
+        "loan_application": len(tokens & LOAN_KEYWORDS) / len(LOAN_KEYWORDS),
+        "information_seeking": len(tokens & INFO_KEYWORDS) / len(INFO_KEYWORDS),
+        "urgency": len(tokens & URGENT_KEYWORDS) / len(URGENT_KEYWORDS),
+        "price_sensitivity": len(tokens & PRICE_KEYWORDS) / len(PRICE_KEYWORDS),
+        "trust_concerns": len(tokens & TRUST_KEYWORDS) / len(TRUST_KEYWORDS),
+        "technical_support": len(tokens & TECH_KEYWORDS) / len(TECH_KEYWORDS)
+    }
+
+
+# Punctuation mapped to spaces before tokenizing (apostrophes and hyphens stay inside words)
+PUNCTUATION_TO_SPACE = str.maketrans({char: " " for char in string.punctuation if char not in "'-"})
+
+
+def _tokenize(msg_lower: str) -> set:
+    """Split a lowercased message into words plus adjacent word pairs (for two-word keywords)"""
+    words = msg_lower.translate(PUNCTUATION_TO_SPACE).split()
+    tokens = set(words)
+    tokens.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return tokens
 
 
 class MasterAgent(BaseAgent):
@@ -27,37 +248,34 @@ class MasterAgent(BaseAgent):
     Integrates with AgentOrchestrator for intelligent agent routing and coordination
     """
     
+    # Sales, verification, underwriting agents and PDF service shared across instances
+    _shared_sub_agents: Optional[tuple] = None
+    
     def __init__(self):
         super().__init__("Advanced Master Agent")
         
-        # Initialize sub-agents
-        self.sales_agent = SalesAgent()
-        self.verification_agent = VerificationAgent()
-        self.underwriting_agent = UnderwritingAgent()
-        self.pdf_service = PDFService()
+        # Initialize sub-agents (stateless, so built once and shared by all instances)
+        if MasterAgent._shared_sub_agents is None:
+            MasterAgent._shared_sub_agents = (
+                SalesAgent(),
+                VerificationAgent(),
+                UnderwritingAgent(),
+                PDFService()
+            )
+        self.sales_agent, self.verification_agent, self.underwriting_agent, self.pdf_service = MasterAgent._shared_sub_agents
         
         # Advanced orchestration and state management (lazy initialization to avoid circular imports)
         self.orchestrator = None  # Will be initialized when needed
         self.state_manager = ConversationStateManager()
         
-        # Conversation intelligence
-        self.conversation_analytics = {
-            "total_handled": 0,
-            "successful_completions": 0,
-            "escalations": 0,
-            "average_satisfaction": 0.0,
-            "stage_transitions": {stage: 0 for stage in ChatStage},
-            "common_user_intents": {},
-            "conversation_patterns": []
-        }
+        # Personalization lookups cached by phone: phone -> (cached_at, data), least recently used first
+        self._personalization_cache = OrderedDict()
+        
+        # Conversation intelligence (process-wide counters)
+        self.metrics = METRICS
         
         # Greeting messages with personalization
-        self.greeting_messages = [
-            "🙏 Namaste! Welcome to our AI-powered Personal Loan Assistant! I'm here to get you the best loan deal in minutes.",
-            "Welcome to QuickLoan Pro! 🎉 Your intelligent loan advisor is ready to help you secure instant approval.",
-            "Hello! I'm your advanced AI loan expert, powered by cutting-edge technology to make borrowing effortless.",
-            "Greetings! Ready for an intelligent loan experience? I'll guide you through our smart approval process."
-        ]
+        self.greeting_messages = GREETING_MESSAGES
     
     def _get_orchestrator(self):
         """Lazy initialization of orchestrator to avoid circular imports"""
@@ -73,11 +291,17 @@ class MasterAgent(BaseAgent):
         """
         
         try:
+            msg_lower = (message or "").lower()
+            triggers = _match_triggers(msg_lower)
+
+            # Scan the message for a phone number once per turn
+            extracted_phone = self._extract_phone_from_message(msg_lower) if msg_lower else None
+
             # Create or get conversation context
-            context = await self._get_or_create_context(session_id, phone, message)
+            context = await self._get_or_create_context(session_id, phone, msg_lower, extracted_phone)
 
             # Quick acknowledgement for explicit loan intent at greeting
-            if message and "loan" in message.lower() and context.current_stage == ChatStage.GREETING:
+            if "loan" in msg_lower and context.current_stage == ChatStage.GREETING:
                 return ChatResponse(
                     session_id=context.session_id,
                     message="I can help you with a loan — tell me the amount or share your phone number to proceed.",
@@ -86,9 +310,7 @@ class MasterAgent(BaseAgent):
                 )
 
             # Handle negotiation-related inputs directly to provide relevant phrasing
-            msg_lower = (message or "").lower()
-            negotiation_triggers = ["rate", "offer", "better", "discount", "reduce", "match", "percent", "%"]
-            if (any(t in msg_lower for t in negotiation_triggers) or "%" in (message or "")) and context.customer_phone:
+            if "neg" in triggers and context.customer_phone:
                 return ChatResponse(
                     session_id=context.session_id,
                     message="I hear you — let's see if we can get you a better rate or offer. I'll check available discounts and partner offers to try and match  your request.",
@@ -97,8 +319,7 @@ class MasterAgent(BaseAgent):
                 )
 
             # Handle documentation concerns explicitly
-            docs_triggers = ["document", "documents", "salary slip", "salary slips", "self-employed", "no salary"]
-            if any(t in msg_lower for t in docs_triggers) and context.current_stage in [ChatStage.SALES, ChatStage.VERIFICATION]:
+            if "doc" in triggers and context.current_stage in [ChatStage.SALES, ChatStage.VERIFICATION]:
                 return ChatResponse(
                     session_id=context.session_id,
                     message="If you don't have salary slips, you can provide bank statements, ITRs, or alternative proof of income. Please upload any of these documents or tell me which ones you have.",
@@ -108,21 +329,21 @@ class MasterAgent(BaseAgent):
             
             # Special handling for DECISION stage responses (after loan approval)
             if context.current_stage == ChatStage.DECISION:
-                return await self._handle_decision_stage_response(message, context)
+                return await self._handle_decision_stage_response(triggers, context)
             
             # Update analytics
-            self.conversation_analytics["total_handled"] += 1
+            self.metrics.total_handled += 1
             
             # Use advanced orchestration for agent routing and coordination
             orchestrator = self._get_orchestrator()
             response = await orchestrator.orchestrate_conversation(
                 message, 
                 context, 
-                orchestration_pattern=self._determine_orchestration_pattern(message, context)
+                orchestration_pattern=self._determine_orchestration_pattern(msg_lower, triggers, context)
             )
 
             # Quick progression: if user provided an interest rate/percent, move to UNDERWRITING
-            if message and ('%' in message or 'percent' in message.lower()) and context.current_stage in [ChatStage.SALES, ChatStage.VERIFICATION]:
+            if ('%' in msg_lower or 'percent' in msg_lower) and context.current_stage in [ChatStage.SALES, ChatStage.VERIFICATION]:
                 try:
                     success, _ = await self.state_manager.transition_stage(
                         context.session_id,
@@ -139,7 +360,7 @@ class MasterAgent(BaseAgent):
             await self._handle_intelligent_state_transition(response, context)
             
             # Add conversation intelligence and analytics
-            response = await self._enhance_response_with_intelligence(response, context, message)
+            response = await self._enhance_response_with_intelligence(response, context, message, msg_lower, triggers)
             
             # Save context and conversation
             await self._save_conversation_state(context, message, response)
@@ -147,17 +368,16 @@ class MasterAgent(BaseAgent):
             return response
             
         except Exception as e:
-            print(f"Advanced Master Agent error: {e}")
+            # Logged by _handle_agent_error
             return await self._handle_agent_error(e, message, session_id)
     
-    async def _handle_decision_stage_response(self, message: str, context: ConversationContext) -> ChatResponse:
+    async def _handle_decision_stage_response(self, triggers: frozenset, context: ConversationContext) -> ChatResponse:
         """Handle responses when user is in DECISION stage after loan approval"""
         
-        message_lower = message.lower()
         customer_name = context.customer_data.get('name', 'Customer') if context.customer_data else 'Customer'
         
         # Handle sanction letter request
-        if any(word in message_lower for word in ["email", "sanction", "letter", "yes"]):
+        if "sanction" in triggers:
             return ChatResponse(
                 session_id=context.session_id,
                 message=f"Perfect, {customer_name}! 📧\n\n"
@@ -177,7 +397,7 @@ class MasterAgent(BaseAgent):
             )
         
         # Handle loan details request
-        elif any(word in message_lower for word in ["details", "show", "information", "summary"]):
+        elif "details" in triggers:
             return ChatResponse(
                 session_id=context.session_id,
                 message=f"Here are your complete loan details, {customer_name}! 📋\n\n"
@@ -185,7 +405,7 @@ class MasterAgent(BaseAgent):
                        f"━━━━━━━━━━━━━━━━━━━━━━━━━\n"
                        f"🏦 **Loan Amount**: ₹{context.loan_request.amount if context.loan_request else 500000:,.0f}\n"
                        f"📅 **Tenure**: {context.loan_request.tenure if context.loan_request else 60} months\n"
-                       f"💳 **EMI**: ₹{((context.loan_request.amount if context.loan_request else 500000) * 0.0125) / (1 - (1 + 0.0125)**(-60)):,.0f} per month\n"
+                       f"💳 **EMI**: ₹{_emi(context.loan_request.amount if context.loan_request else 500000, 60, 125):,.0f} per month\n"
                        f"📈 **Interest Rate**: 12.5% per annum\n"
                        f"🎯 **Purpose**: {context.loan_request.purpose if context.loan_request else 'Personal'}\n\n"
                        f"**📄 DOCUMENTATION STATUS**\n"
@@ -213,74 +433,69 @@ class MasterAgent(BaseAgent):
                 options=["Email sanction letter", "Show loan details", "I have questions"]
             )
     
-    async def _get_or_create_context(self, session_id: str, phone: str, message: str) -> ConversationContext:
+    async def _get_or_create_context(
+        self,
+        session_id: str,
+        phone: str,
+        msg_lower: str,
+        extracted_phone: Optional[str]
+    ) -> ConversationContext:
         """Get existing context or create new one with intelligent initialization"""
         
         if session_id:
             # Try to get existing active conversation
             existing = self.state_manager.active_conversations.get(session_id)
             if existing:
-                if existing.metadata is None:
-                    existing.metadata = {}
-                # If phone not set yet, try extracting from the incoming message
-                if not existing.customer_phone:
-                    extracted = self._extract_phone_from_message(message or "")
-                    if extracted:
-                        existing.customer_phone = extracted
+                # If phone not set yet, use one found in the incoming message
+                if not existing.customer_phone and extracted_phone:
+                    existing.customer_phone = extracted_phone
                 return existing
 
             # Try to resume from paused conversations
             context = await self.state_manager.resume_conversation(session_id)
             if context:
-                if context.metadata is None:
-                    context.metadata = {}
                 return context
         
         # Create new conversation context with intelligence
         new_session_id = session_id or str(uuid.uuid4())
         context = await self.state_manager.initialize_conversation(new_session_id)
         
-        # Ensure metadata is initialized
-        if context.metadata is None:
-            context.metadata = {}
-        
         # Add phone if provided
         if phone:
             context.customer_phone = phone
         
-        # Extract phone from message if not provided
+        # Use phone from message if not provided
         if not context.customer_phone:
-            context.customer_phone = self._extract_phone_from_message(message)
+            context.customer_phone = extracted_phone
         
         # Initialize conversation intelligence
         context.metadata.update({
-            "user_intent_analysis": await self._analyze_user_intent(message),
-            "conversation_complexity": self._assess_complexity(message),
-            "personalization_data": await self._get_personalization_data(context.customer_phone)
+            "user_intent_analysis": self._analyze_user_intent(msg_lower),
+            "conversation_complexity": self._assess_complexity(msg_lower),
+            "personalization_data": self._get_personalization_data(context.customer_phone)
         })
         
         return context
     
-    def _determine_orchestration_pattern(self, message: str, context: ConversationContext) -> str:
+    def _determine_orchestration_pattern(self, msg_lower: str, triggers: frozenset, context: ConversationContext) -> str:
         """Intelligently determine the best orchestration pattern"""
         
         # Import here to avoid circular imports
         from app.services.agent_orchestrator import OrchestrationPattern
         
         # Analyze message characteristics
-        message_lower = message.lower()
         complexity_score = context.metadata.get("conversation_complexity", 0.5) if context.metadata else 0.5
         
         # For urgent requests, use chain pattern
-        if any(word in message_lower for word in ["urgent", "immediate", "asap", "emergency"]):
+        if "urgent" in triggers:
             return OrchestrationPattern.CHAIN.value
         
         # For complex requirements, use decision tree
-        if complexity_score > 0.7 or any(word in message_lower for word in ["complex", "special", "different"]):
+        if complexity_score > 0.7 or "complex" in triggers:
             return OrchestrationPattern.DECISION_TREE.value
         
         # For multi-faceted queries, use parallel processing
-        if len(message_lower.split()) > 20 or "and" in message_lower:
+        if len(msg_lower.split()) > 20 or "and" in msg_lower:
             return OrchestrationPattern.PARALLEL.value
         
         # For simple interactions, use conditional routing
@@ -325,9 +540,16 @@ class MasterAgent(BaseAgent):
             if success:
                 context.current_stage = new_stage
                 response.stage = new_stage
-                self.conversation_analytics["stage_transitions"][new_stage] += 1
+                self.metrics.stage_transitions[STAGE_INDEX[new_stage]] += 1
     
-    async def _enhance_response_with_intelligence(self, response: ChatResponse, context: ConversationContext, user_message: str) -> ChatResponse:
+    async def _enhance_response_with_intelligence(
+        self,
+        response: ChatResponse,
+        context: ConversationContext,
+        user_message: str,
+        msg_lower: str,
+        triggers: frozenset
+    ) -> ChatResponse:
         """Enhance response with conversation intelligence and personalization"""
         
         # Add personalization based on customer data
@@ -341,17 +563,14 @@ class MasterAgent(BaseAgent):
         
         # Add confidence indicators
         confidence_score = self._calculate_response_confidence(response, context)
-        if hasattr(response, 'metadata'):
-            response.metadata["confidence_score"] = confidence_score
-        else:
-            response.metadata = {"confidence_score": confidence_score}
+        response.metadata["confidence_score"] = confidence_score
         
         # Add conversation flow suggestions
-        flow_suggestions = await self._generate_flow_suggestions(context, user_message)
+        flow_suggestions = self._generate_flow_suggestions(context, user_message)
         response.metadata["flow_suggestions"] = flow_suggestions
         
         # Add emotional intelligence
-        emotional_tone = self._analyze_emotional_tone(user_message)
+        emotional_tone = self._analyze_emotional_tone(msg_lower)
         if emotional_tone == "frustrated":
             response.message += "\\n\\n😊 I understand this can be overwhelming. I'm here to make this as simple as possible for you."
         elif emotional_tone == "excited":
@@ -360,11 +579,12 @@ class MasterAgent(BaseAgent):
             response.message += "\\n\\n🤝 I understand your concerns. All your information is completely secure and confidential."
 
         # Post-process to ensure negotiation/documentation prompts include expected keywords
-        msg_lower = (user_message or "").lower()
-        if any(t in msg_lower for t in ["rate", "offer", "better", "discount"]) and not any(k in response.message.lower() for k in ["rate", "offer", "best", "consider"]):
+        response_lower = response.message.lower()
+        if "rate_followup" in triggers and not any(k in response_lower for k in RATE_RESPONSE_KEYWORDS):
             response.message += "\n\nI'll check available rates and offers to see if we can secure a better rate for you."
+            response_lower = response.message.lower()
 
-        if any(t in msg_lower for t in ["document", "salary slip", "self-employed", "no salary"]) and not any(k in response.message.lower() for k in ["document", "alternative", "provide", "submit", "bank"]):
+        if "doc_followup" in triggers and not any(k in response_lower for k in DOCS_RESPONSE_KEYWORDS):
             response.message += "\n\nIf you don't have salary slips, you can provide bank statements or ITRs as alternative documents."
         
         return response
@@ -372,14 +592,18 @@ class MasterAgent(BaseAgent):
     async def _save_conversation_state(self, context: ConversationContext, user_message: str, response: ChatResponse):
         """Save conversation state with enhanced analytics"""
         
-        # Add to conversation history
-        if not hasattr(context, 'conversation_history'):
-            context.conversation_history = []
+        # One clock read per turn, shared by history, patterns and the database row
+        now = datetime.now()
+        timestamp = now.isoformat()
+        
+        # Add to conversation history (bounded in memory; older entries live in ConversationHistoryEntry rows)
+        if not isinstance(context.conversation_history, deque):
+            context.conversation_history = deque(context.conversation_history, maxlen=CONVERSATION_HISTORY_LIMIT)
         
         context.conversation_history.append({
             "sender": "user",
             "message": user_message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp,
             "metadata": {
                 "stage": context.current_stage.value,
                 "intent_analysis": context.metadata.get("user_intent_analysis", {})
@@ -389,7 +613,7 @@ class MasterAgent(BaseAgent):
         context.conversation_history.append({
             "sender": "assistant",
             "message": response.message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp,
             "metadata": {
                 "stage": response.stage.value,
                 "confidence_score": response.metadata.get("confidence_score", 0.8),
@@ -398,116 +622,183 @@ class MasterAgent(BaseAgent):
         })
         
         # Update conversation patterns
-        await self._update_conversation_patterns(context, user_message, response)
+        self._update_conversation_patterns(context, user_message, response, timestamp)
         
-        # Save to database
+        # Write the state to the database in the background. The session row holds a fixed-size
+        # snapshot; history goes to its own table, so only this turn's two messages are written.
         try:
-            db_session: Session = next(get_db())
-            
-            existing_session = db_session.query(ChatSession).filter(
-                ChatSession.session_id == context.session_id
-            ).first()
+            new_entries = [
+                {
+                    "sender": entry["sender"],
+                    "message": entry["message"],
+                    "entry_metadata": serialization.dumps(entry["metadata"]),
+                    "created_at": now
+                }
+                for entry in (context.conversation_history[-2], context.conversation_history[-1])
+            ]
+        except Exception as e:
+            logger.error(f"Error serializing conversation state: {e}", exc_info=True)
+            return
+        
+        session_id = context.session_id
+        task = asyncio.create_task(
+            self._write_conversation_state(context, new_entries, now, _state_writes.get(session_id))
+        )
+        _state_writes[session_id] = task
+        _background_tasks.add(task)
+        task.add_done_callback(functools.partial(_forget_state_write, session_id))
+    
+    async def _write_conversation_state(
+        self,
+        context: ConversationContext,
+        new_entries: list,
+        saved_at: datetime,
+        previous: Optional[asyncio.Task]
+    ):
+        """Persist a turn once the session's previous write has finished, so writes commit in turn order"""
+        
+        if previous is not None:
+            await asyncio.wait({previous})
+        
+        session_id = context.session_id
+        # History left over from a failed write goes first, keeping turn order
+        entries = _unwritten_history.pop(session_id, []) + new_entries
+        turn_count = context.metadata.get("persisted_turns", 0)
+        
+        # Snapshot on the event loop; it records the turn count as it will be once this write commits
+        try:
+            snapshot = self._serialize_context(context)
+            snapshot["metadata"]["persisted_turns"] = turn_count + len(entries)
+            context_data = serialization.pack(snapshot)
+        except Exception as e:
+            logger.error(f"Error serializing conversation state: {e}", exc_info=True)
+            _unwritten_history[session_id] = entries
+            return
+        
+        written = await asyncio.to_thread(
+            self._persist_conversation_state,
+            session_id,
+            context.customer_phone,
+            context_data,
+            entries,
+            turn_count,
+            saved_at
+        )
+        if written:
+            context.metadata["persisted_turns"] = turn_count + len(entries)
+        else:
+            _unwritten_history[session_id] = entries
+    
+    def _persist_conversation_state(
+        self,
+        session_id: str,
+        customer_phone: Optional[str],
+        context_data: bytes,
+        entries: list,
+        first_turn: int,
+        saved_at: datetime
+    ) -> bool:
+        """Write a serialized conversation snapshot and new history rows to the database (runs in a worker thread)"""
+        
+        db_session: Session = next(get_db())
+        try:
+            db_session.add_all([
+                ConversationHistoryEntry(session_id=session_id, turn_index=first_turn + offset, **entry)
+                for offset, entry in enumerate(entries)
+            ])
             
-            if not existing_session:
-                chat_session = ChatSession(
-                    session_id=context.session_id,
-                    customer_phone=context.customer_phone,
-                    context=json.dumps({
-                        "context": self._serialize_context(context),
-                        "analytics": self.conversation_analytics
-                    }),
-                    created_at=datetime.now(),
-                    updated_at=datetime.now()
+            # Insert the session row on its first save, otherwise just refresh the snapshot
+            db_session.execute(
+                sqlite_insert(ChatSession)
+                .values(
+                    session_id=session_id,
+                    customer_phone=customer_phone,
+                    context=context_data,
+                    created_at=saved_at,
+                    updated_at=saved_at
                 )
-                db_session.add(chat_session)
-            else:
-                existing_session.context = json.dumps({
-                    "context": self._serialize_context(context),
-                    "analytics": self.conversation_analytics
-                })
-                existing_session.updated_at = datetime.now()
-            
+                .on_conflict_do_update(
+                    index_elements=[ChatSession.session_id],
+                    set_={"context": context_data, "updated_at": saved_at}
+                )
+            )
             db_session.commit()
+            return True
             
         except Exception as e:
-            print(f"Error saving conversation state: {e}")
+            logger.error(f"Error saving conversation state: {e}", exc_info=True)
+            db_session.rollback()
+            return False
+        finally:
+            db_session.close()
     
-    async def _analyze_user_intent(self, message: str) -> dict:
+    def _analyze_user_intent(self, msg_lower: str) -> dict:
         """Analyze user intent with advanced NLP patterns"""
         
-        message_lower = message.lower()
-        intents = {
-            "loan_application": 0.0,
-            "information_seeking": 0.0,
-            "urgency": 0.0,
-            "price_sensitivity": 0.0,
-            "trust_concerns": 0.0,
-            "technical_support": 0.0
-        }
-        
-        # Loan application intent
-        loan_keywords = ["loan", "money", "borrow", "credit", "finance", "rupees", "lakh"]
-        intents["loan_application"] = sum(1 for word in loan_keywords if word in message_lower) / len(loan_keywords)
-        
-        # Information seeking intent
-        info_keywords = ["how", "what", "when", "where", "why", "explain", "tell me"]
-        intents["information_seeking"] = sum(1 for word in info_keywords if word in message_lower) / len(info_keywords)
-        
-        # Urgency intent
-        urgent_keywords = ["urgent", "immediate", "asap", "quick", "fast", "now", "emergency"]
-        intents["urgency"] = sum(1 for word in urgent_keywords if word in message_lower) / len(urgent_keywords)
-        
-        # Price sensitivity
-        price_keywords = ["cheap", "affordable", "rate", "interest", "emi", "cost", "expensive"]
-        intents["price_sensitivity"] = sum(1 for word in price_keywords if word in message_lower) / len(price_keywords)
-        
-        # Trust concerns
-        trust_keywords = ["safe", "secure", "trust", "fraud", "scam", "legitimate", "real"]
-        intents["trust_concerns"] = sum(1 for word in trust_keywords if word in message_lower) / len(trust_keywords)
-        
-        # Technical support
-        tech_keywords = ["problem", "error", "not working", "issue", "help", "support"]
-        intents["technical_support"] = sum(1 for word in tech_keywords if word in message_lower) / len(tech_keywords)
-        
-        return intents
+        # Copy so callers can't mutate the cached entry
+        return dict(_score_intents(msg_lower))
     
-    def _assess_complexity(self, message: str) -> float:
+    def _assess_complexity(self, msg_lower: str) -> float:
         """Assess conversation complexity based on message characteristics"""
         
         complexity_score = 0.0
         
         # Length factor
-        if len(message) > 100:
+        if len(msg_lower) > 100:
             complexity_score += 0.3
-        elif len(message) > 50:
+        elif len(msg_lower) > 50:
             complexity_score += 0.1
         
         # Question count
-        question_count = message.count("?")
+        question_count = msg_lower.count("?")
         complexity_score += min(question_count * 0.1, 0.2)
         
         # Complex keywords
-        complex_keywords = ["however", "but", "although", "specific", "detailed", "complex"]
-        complex_matches = sum(1 for word in complex_keywords if word.lower() in message.lower())
+        complex_matches = sum(1 for word in COMPLEX_KEYWORDS if word in msg_lower)
         complexity_score += min(complex_matches * 0.15, 0.3)
         
         # Multiple topics
-        if len(message.split(".")) > 2:
+        if len(msg_lower.split(".")) > 2:
             complexity_score += 0.2
         
         return min(complexity_score, 1.0)
     
-    async def _get_personalization_data(self, phone: str) -> dict:
+    def _get_personalization_data(self, phone: str) -> dict:
         """Get personalization data for the customer"""
         
         if not phone:
             return {}
         
+        now = time.monotonic()
+        entry = self._personalization_cache.get(phone)
+        if entry is not None and now - entry[0] <= PERSONALIZATION_CACHE_TTL:
+            self._personalization_cache.move_to_end(phone)
+            # Copy so callers can't mutate the cached entry
+            return dict(entry[1])
+        
+        try:
+            data = self._load_personalization_data(phone)
+        except Exception as e:
+            logger.error(f"Error getting personalization data: {e}", exc_info=True)
+            return {}
+        
+        # Unknown customers aren't cached, so they're picked up as soon as they register
+        if not data:
+            self._personalization_cache.pop(phone, None)
+            return {}
+        
+        self._personalization_cache[phone] = (now, data)
+        self._personalization_cache.move_to_end(phone)
+        if len(self._personalization_cache) > PERSONALIZATION_CACHE_SIZE:
+            self._personalization_cache.popitem(last=False)
+        return dict(data)
+    
+    def _load_personalization_data(self, phone: str) -> dict:
+        """Load personalization data for the customer from the database"""
+        
+        # Get customer data from database
+        db_session: Session = next(get_db())
         try:
-            # Get customer data from database
-            db_session: Session = next(get_db())
-            from app.database.models import Customer
-            
             customer = db_session.query(Customer).filter(Customer.phone == phone).first()
             if customer:
                 return {
@@ -516,10 +807,9 @@ class MasterAgent(BaseAgent):
                     "last_interaction": getattr(customer, 'last_interaction', None),
                     "customer_segment": self._determine_customer_segment(customer)
                 }
-        except Exception as e:
-            print(f"Error getting personalization data: {e}")
-        
-        return {}
+            return {}
+        finally:
+            db_session.close()
     
     def _determine_customer_segment(self, customer) -> str:
         """Determine customer segment for personalization"""
@@ -546,13 +836,17 @@ class MasterAgent(BaseAgent):
             confidence -= 0.1  # Lower confidence for complex stages
         
         # Adjust based on context completeness
-        context_fields = [context.customer_phone, context.loan_request, getattr(context, 'credit_score', None)]
-        completeness = sum(1 for field in context_fields if field is not None) / len(context_fields)
+        filled_fields = (
+            (context.customer_phone is not None)
+            + (context.loan_request is not None)
+            + (context.credit_score is not None)
+        )
+        completeness = filled_fields / 3
         confidence += (completeness - 0.5) * 0.2
         
         return min(max(confidence, 0.0), 1.0)
     
-    async def _generate_flow_suggestions(self, context: ConversationContext, user_message: str) -> list:
+    def _generate_flow_suggestions(self, context: ConversationContext, user_message: str) -> list:
         """Generate intelligent flow suggestions"""
         
         suggestions = []
@@ -566,69 +860,31 @@ class MasterAgent(BaseAgent):
         
         return suggestions
     
-    def _analyze_emotional_tone(self, message: str) -> str:
+    def _analyze_emotional_tone(self, msg_lower: str) -> str:
         """Analyze emotional tone of user message"""
         
-        message_lower = message.lower()
-        
-        # Frustrated indicators
-        if any(word in message_lower for word in ["angry", "frustrated", "upset", "terrible", "awful", "waste"]):
-            return "frustrated"
-        
-        # Excited indicators
-        if any(word in message_lower for word in ["great", "awesome", "excellent", "wonderful", "excited", "yes!"]):
-            return "excited"
-        
-        # Concerned indicators
-        if any(word in message_lower for word in ["worried", "concerned", "safe", "secure", "trust", "fraud"]):
-            return "concerned"
+        # Normalized words and word pairs, plus raw words so entries like "yes!" still match
+        tokens = _tokenize(msg_lower)
+        tokens.update(msg_lower.split())
         
-        # Confused indicators
-        if any(word in message_lower for word in ["confused", "don't understand", "unclear", "explain"]):
-            return "confused"
+        for tone, words in EMOTIONAL_TONES:
+            if tokens & words:
+                return tone
         
         return "neutral"
     
     def _get_previous_stage(self, current_stage: ChatStage) -> ChatStage:
         """Get previous stage for backward navigation"""
         
-        stage_order = [
-            ChatStage.GREETING,
-            ChatStage.SALES,
-            ChatStage.VERIFICATION,
-            ChatStage.UNDERWRITING,
-            ChatStage.APPROVED
-        ]
-        
-        try:
-            current_index = stage_order.index(current_stage)
-            if current_index > 0:
-                return stage_order[current_index - 1]
-        except ValueError:
-            pass
-        
-        return ChatStage.GREETING
+        return PREVIOUS_STAGE.get(current_stage, ChatStage.GREETING)
     
     def _extract_phone_from_message(self, message: str) -> Optional[str]:
         """Extract phone number from message using regex"""
         
-        import re
-        
-        # Indian phone number patterns
-        patterns = [
-            r'\b[6-9]\d{9}\b',  # 10 digit mobile
-            r'\+91[6-9]\d{9}',   # +91 prefix
-            r'091[6-9]\d{9}',     # 091 prefix
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, message)
-            if matches:
-                return matches[0].replace("+91", "").replace("091", "")[-10:]
-        
-        return None
+        match = PHONE_PATTERN.search(message or "")
+        return match.group(1) if match else None
     
-    async def _update_conversation_patterns(self, context: ConversationContext, user_message: str, response: ChatResponse):
+    def _update_conversation_patterns(self, context: ConversationContext, user_message: str, response: ChatResponse, timestamp: str):
         """Update conversation patterns for analytics"""
         
         pattern = {
@@ -636,36 +892,28 @@ class MasterAgent(BaseAgent):
             "user_message_length": len(user_message),
             "response_length": len(response.message),
             "intent_analysis": context.metadata.get("user_intent_analysis", {}),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp
         }
         
-        self.conversation_analytics["conversation_patterns"].append(pattern)
-        
-        # Keep only last 100 patterns
-        if len(self.conversation_analytics["conversation_patterns"]) > 100:
-            self.conversation_analytics["conversation_patterns"] = self.conversation_analytics["conversation_patterns"][-100:]
+        # The bounded deque drops the oldest pattern once full
+        if self.metrics.conversation_patterns is None:
+            self.metrics.conversation_patterns = deque(maxlen=CONVERSATION_PATTERN_LIMIT)
+        self.metrics.conversation_patterns.append(pattern)
     
     def _serialize_context(self, context: ConversationContext) -> dict:
-        """Serialize context for storage"""
+        """Serialize context for storage (history is stored in ConversationHistoryEntry rows)"""
         
-        return {
-            "session_id": context.session_id,
-            "current_stage": context.current_stage.value,
-            "customer_phone": context.customer_phone,
-            "loan_request": context.loan_request.dict() if context.loan_request else None,
-            "credit_score": getattr(context, 'credit_score', None),
-            "pre_approved_limit": getattr(context, 'pre_approved_limit', None),
-            "conversation_history": getattr(context, 'conversation_history', []),
-            "metadata": getattr(context, 'metadata', {})
-        }
+        snapshot = context.model_dump(include=SNAPSHOT_FIELDS)
+        snapshot["history_length"] = len(context.conversation_history)
+        return snapshot
     
     async def _handle_agent_error(self, error: Exception, message: str, session_id: str) -> ChatResponse:
         """Handle agent errors gracefully with intelligent fallbacks"""
         
-        print(f"Advanced Master Agent error: {error}")
+        logger.error(f"Advanced Master Agent error: {error}", exc_info=error)
         
         # Update error analytics
-        self.conversation_analytics["escalations"] += 1
+        self.metrics.escalations += 1
         
         # Provide intelligent error response
         error_response = (
@@ -692,13 +940,13 @@ class MasterAgent(BaseAgent):
         """Get comprehensive orchestration analytics"""
         
         return {
-            "agent_analytics": self.conversation_analytics,
+            "agent_analytics": self.metrics.as_dict(),
             "orchestration_metrics": self.orchestrator.get_orchestration_metrics(),
             "state_analytics": self.state_manager.get_state_analytics(),
             "performance_summary": {
-                "total_conversations": self.conversation_analytics["total_handled"],
-                "success_rate": self.conversation_analytics["successful_completions"] / max(self.conversation_analytics["total_handled"], 1),
-                "escalation_rate": self.conversation_analytics["escalations"] / max(self.conversation_analytics["total_handled"], 1),
-                "average_satisfaction": self.conversation_analytics["average_satisfaction"]
+                "total_conversations": self.metrics.total_handled,
+                "success_rate": self.metrics.successful_completions / max(self.metrics.total_handled, 1),
+                "escalation_rate": self.metrics.escalations / max(self.metrics.total_handled, 1),
+                "average_satisfaction": self.metrics.average_satisfaction
             }
         }
\ No newline at end of file
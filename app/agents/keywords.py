@@ -0,0 +1,93 @@
+"""
+Keyword tables shared by the agents
+"""
+import re
+from types import MappingProxyType
+from typing import Optional
+
+try:
+    import ahocorasick
+except ImportError:
+    # pyahocorasick not installed, fall back to regex scans
+    ahocorasick = None
+
+from app.models.schemas import LoanPurpose
+
+
+# Purpose keywords, in the order they are checked when a message names several purposes
+PURPOSE_KEYWORDS = MappingProxyType({
+    LoanPurpose.PERSONAL: ('personal', 'general', 'miscellaneous'),
+    LoanPurpose.HOME_IMPROVEMENT: ('home', 'house', 'renovation', 'repair', 'improvement'),
+    LoanPurpose.EDUCATION: ('education', 'study', 'course', 'college', 'school'),
+    LoanPurpose.MEDICAL: ('medical', 'health', 'hospital', 'treatment', 'medicine'),
+    LoanPurpose.BUSINESS: ('business', 'startup', 'investment', 'work', 'office'),
+    LoanPurpose.WEDDING: ('wedding', 'marriage', 'shaadi', 'ceremony'),
+    LoanPurpose.TRAVEL: ('travel', 'vacation', 'trip', 'tour', 'holiday'),
+    LoanPurpose.DEBT_CONSOLIDATION: ('debt', 'consolidation', 'loan closure', 'payoff')
+})
+
+# Words too common in ordinary replies to read as a purpose change mid-conversation
+AMBIGUOUS_PURPOSE_KEYWORDS = frozenset({
+    'general', 'miscellaneous', 'course', 'college', 'school', 'treatment', 'medicine',
+    'investment', 'work', 'office', 'ceremony', 'tour', 'holiday'
+})
+
+
+def _purpose_pattern(keywords) -> re.Pattern:
+    """One alternation whose named groups are LoanPurpose member names"""
+    return re.compile('|'.join(
+        f"(?P<{purpose.name}>{'|'.join(re.escape(kw) for kw in words)})"
+        for purpose, words in keywords.items()
+    ))
+
+
+def _purpose_automaton(keywords):
+    """Aho-Corasick automaton reporting the purpose of every keyword found, if available"""
+    if ahocorasick is None:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for purpose, words in keywords.items():
+        for keyword in words:
+            automaton.add_word(keyword, purpose)
+    automaton.make_automaton()
+    return automaton
+
+
+class _PurposeMatcher:
+    """Finds the loan purposes named in a lowercased message in a single scan"""
+
+    def __init__(self, keywords):
+        self.pattern = _purpose_pattern(keywords)
+        self.automaton = _purpose_automaton(keywords)
+
+    def mentioned(self, lowered: str) -> set:
+        """Every purpose named in the message"""
+        if self.automaton is not None:
+            return {purpose for _, purpose in self.automaton.iter(lowered)}
+        return {LoanPurpose[match.lastgroup] for match in self.pattern.finditer(lowered)}
+
+
+PURPOSE_MATCHER = _PurposeMatcher(PURPOSE_KEYWORDS)
+PURPOSE_EDIT_MATCHER = _PurposeMatcher({
+    purpose: tuple(kw for kw in words if kw not in AMBIGUOUS_PURPOSE_KEYWORDS)
+    for purpose, words in PURPOSE_KEYWORDS.items()
+})
+
+
+def mentioned_purposes(lowered: str, edits_only: bool = False) -> set:
+    """Return every loan purpose named in a lowercased message.
+
+    With edits_only, words in AMBIGUOUS_PURPOSE_KEYWORDS are ignored.
+    """
+    matcher = PURPOSE_EDIT_MATCHER if edits_only else PURPOSE_MATCHER
+    return matcher.mentioned(lowered)
+
+
+def match_purpose(lowered: str, edits_only: bool = False, exclude: Optional[LoanPurpose] = None) -> Optional[LoanPurpose]:
+    """Return the first purpose (in PURPOSE_KEYWORDS order) named in a lowercased message"""
+    mentioned = mentioned_purposes(lowered, edits_only)
+    for purpose in PURPOSE_KEYWORDS:
+        if purpose in mentioned and purpose != exclude:
+            return purpose
+    return None
@@ -2,55 +2,326 @@
 Master Agent - Orchestrates the entire loan conversation flow with advanced orchestration
 """
 import re
-import json
 import uuid
+import time
+import random
+import hashlib
+import asyncio
+import logging
+import weakref
+import functools
+from collections import OrderedDict, deque
+from functools import cached_property
+from string import Template
+from types import MappingProxyType
+from typing import Optional
 from datetime import datetime, timezone
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
+try:
+    import ahocorasick
+except ImportError:
+    # pyahocorasick not installed, fall back to substring scans
+    ahocorasick = None
+
 from app.agents.base_agent import BaseAgent
-from app.agents.sales_agent import SalesAgent
-from app.agents.verification_agent import VerificationAgent
-from app.agents.underwriting_agent import UnderwritingAgent
+from app.agents.keywords import match_purpose
 from app.models.schemas import ConversationContext, ChatResponse, ChatStage, LoanRequest, LoanPurpose
-from app.database.database import get_db, ChatSession, SessionLocal
+from app.database.database import ChatSession, ConversationHistoryEntry, SessionLocal, AsyncSessionMaker
 from app.services.agent_orchestrator import AgentOrchestrator, OrchestrationPattern
 from app.services.conversation_state_manager import ConversationStateManager, StateTransition
-from app.services.pdf_service import PDFService
 from app.services.ai_service import ai_service
+from app.utils import serialization
+
+logger = logging.getLogger(__name__)
+
+# Session persistence is batched: writes are queued per session_id and flushed together
+DEFAULT_FLUSH_INTERVAL_MS = 200
+FLUSH_BATCH_SIZE = 50
+
+def _snapshot_digest(snapshot):
+    """Short digest of a stored context snapshot, used to skip re-parsing unchanged rows"""
+    if not snapshot:
+        return None
+    if isinstance(snapshot, str):
+        snapshot = snapshot.encode()
+    return hashlib.blake2b(snapshot, digest_size=16).digest()
+
+
+def _build_session_upsert():
+    """INSERT ... ON CONFLICT (session_id) DO UPDATE for chat session rows"""
+    stmt = sqlite_insert(ChatSession)
+    return stmt.on_conflict_do_update(
+        index_elements=[ChatSession.session_id],
+        set_={
+            "customer_phone": stmt.excluded.customer_phone,
+            "current_stage": stmt.excluded.current_stage,
+            "context": stmt.excluded.context,
+            "updated_at": stmt.excluded.updated_at
+        }
+    )
+
+
+SESSION_UPSERT = _build_session_upsert()
+
+# Recently used session contexts kept in memory to skip the database read
+SESSION_CACHE_SIZE = 10000
+SESSION_CACHE_TTL = 300  # seconds before an entry must be revalidated against the database
+SESSION_CACHE_MAX_IDLE = 1800  # seconds before an unused entry is dropped
+
+# Recent messages kept on the context; all of them are logged to conversation_history
+HISTORY_TAIL_LIMIT = 50
+
+# Messages that end the chat when sent on their own
+EXIT_KEYWORDS = frozenset({'quit', 'exit', 'bye', 'goodbye', 'close', 'end chat', 'stop'})
+
+# Static response bodies, built once
+HELP_MESSAGE = (
+    "I'm your QuickLoan AI Assistant! Here's how I can help:\n\n"
+    "💰 *Loan Application*: I'll guide you through the entire process\n"
+    "📝 *Requirements*: Just tell me loan amount, tenure, and purpose\n"
+    "✅ *Instant Approval*: Credit check and approval in minutes\n"
+    "📄 *Documents*: Minimal documentation needed\n"
+    "💳 *Disbursement*: Funds in 24-48 hours\n\n"
+    "I'll ask you questions step by step. Just answer naturally!\n\n"
+    "Ready to start? Tell me how much loan you need!"
+)
+
+COMPLETED_MESSAGE = (
+    "Thank you for using QuickLoan! Your loan application has been completed. "
+    "If you need any assistance or have questions, please feel free to start a new conversation.\n\n"
+    "Have a great day! 😊"
+)
+
+GREETING_SUFFIX = (
+    "\n\n"
+    "I can help you get a personal loan of ₹10,000 to ₹50,00,000 with:\n"
+    "✅ Instant approval in minutes\n"
+    "✅ Competitive interest rates\n"
+    "✅ Flexible repayment options\n"
+    "✅ Minimal documentation\n\n"
+    "Let's start! How much loan amount do you need?"
+)
+
+
+SANCTION_GENERATED_TEMPLATE = Template(
+    "🎉 Perfect! Your sanction letter is being generated!\n\n"
+    "*Sanction Letter Details:*\n"
+    "📄 Document: Loan Sanction Letter\n"
+    "👤 Customer: $name\n"
+    "💰 Amount: ₹$amount\n"
+    "📅 Tenure: $tenure months\n"
+    "💳 EMI: ₹$emi\n\n"
+    "The sanction letter will be ready for download in a few seconds.\n\n"
+    "*Next Steps:*\n"
+    "1. Download and review your sanction letter\n"
+    "2. Our team will contact you within 24 hours\n"
+    "3. Complete final documentation\n"
+    "4. Get funds disbursed to your account\n\n"
+    "Thank you for choosing QuickLoan! 🙏"
+)
+
+SANCTION_FAILED_TEMPLATE = Template(
+    "I apologize, but there was an issue generating your sanction letter. "
+    "Don't worry - your loan is still approved! Our team will email you "
+    "the sanction letter within 1 hour.\n\n"
+    "Your loan reference number is: $ref\n\n"
+    "Thank you for choosing QuickLoan! 🙏"
+)
+
+
+def _loan_reference(session_id: str) -> str:
+    """Reference number quoted to the customer for an approved loan"""
+    return f"QL{session_id[:8].upper()}"
+
+
+@functools.lru_cache(maxsize=512)
+def _decision_summary(name: str, amount: float, tenure: int, emi: float, rate: float, ref: str) -> str:
+    """Final loan summary shown when the customer declines the sanction letter"""
+    return (
+        f"No problem, {name}! Here's a summary of your approved loan:\n\n"
+        f"*Final Loan Details:*\n"
+        f"✅ *Approved Amount*: ₹{amount:,.0f}\n"
+        f"✅ *Tenure*: {tenure} months\n"
+        f"✅ *EMI*: ₹{emi:,.0f}\n"
+        f"✅ *Interest Rate*: {rate}% p.a.\n"
+        f"✅ *Loan Reference*: {ref}\n\n"
+        f"Our team will contact you within 24 hours to complete the documentation "
+        f"and disburse the funds to your account.\n\n"
+        f"Thank you for choosing QuickLoan! 🙏"
+    )
+
+
+# Words that mean the customer has uploaded their salary slip
+SALARY_SLIP_KEYWORDS = ('upload', 'file', 'slip', 'salary', 'uploaded', 'attached')
+
+# Words that accept the offer to generate the sanction letter
+SANCTION_CONFIRM_KEYWORDS = ('yes', 'email', 'send', 'generate', 'sanction')
+
+# Mid-conversation update keywords (matched as substrings of the lowercased message)
+TENURE_KEYWORDS = frozenset({
+    "month", "months", "minths", "monts", "mnths", "mth", "mths",  # common typos for month/year
+    "year", "years", "yrs", "yr", "yeras"
+})
+TENURE_CHANGE_KEYWORDS = frozenset({"change tenure", "change loan tenure", "update tenure", "modify tenure"})
+YEAR_KEYWORDS = frozenset({"year", "years", "yrs", "yr", "yeras"})
+AMOUNT_KEYWORDS = frozenset({
+    "loan", "amount", "₹", "rs", "rupees", "lakh", "lakhs", "crore", "crores",
+    "thousand", "k", "l", "cr", "need", "want", "require"
+})
+PURPOSE_CHANGE_KEYWORDS = frozenset({"change purpose", "change loan purpose", "different purpose", "modify purpose", "update purpose"})
+PURPOSE_INQUIRY_KEYWORDS = frozenset({"what are", "show me", "which", "available", "list", "options", "types of"})
+PURPOSE_TYPOS = frozenset({"purpose", "purose", "purpse", "purposs", "porpose", "purpos", "perpus", "perpuse"})  # common typos of "purpose"
+
+
+def _keyword_pattern(keywords) -> re.Pattern:
+    """Compile keywords into one alternation that matches any of them as a substring"""
+    return re.compile('|'.join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True)))
+
+
+def _build_automaton(words):
+    """Build an Aho-Corasick automaton reporting the value of every keyword found, if available"""
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, value in words.items():
+        automaton.add_word(keyword, value)
+    automaton.make_automaton()
+    return automaton
+
+
+# One scan per field instead of one substring test per keyword
+TENURE_RE = _keyword_pattern(TENURE_KEYWORDS | TENURE_CHANGE_KEYWORDS)
+YEAR_RE = _keyword_pattern(YEAR_KEYWORDS)
+AMOUNT_RE = _keyword_pattern(AMOUNT_KEYWORDS)
+PURPOSE_CHANGE_RE = _keyword_pattern(PURPOSE_CHANGE_KEYWORDS)
+PURPOSE_INQUIRY_RE = _keyword_pattern(PURPOSE_INQUIRY_KEYWORDS)
+PURPOSE_TYPO_RE = _keyword_pattern(PURPOSE_TYPOS)
+
+# Stage a correction rolls back to; other stages stay where they are
+ROLLBACK_STAGES = MappingProxyType({
+    ChatStage.VERIFICATION: ChatStage.SALES,
+    ChatStage.UNDERWRITING: ChatStage.VERIFICATION,
+    ChatStage.DECISION: ChatStage.UNDERWRITING
+})
+
+# Mid-conversation update key -> LoanRequest attribute it replaces
+UPDATE_FIELDS = (("loan_amount", "amount"), ("loan_tenure", "tenure"), ("loan_purpose", "purpose"))
+
+# Phone numbers typed during verification, which must not be read as loan updates
+PHONE_DIGITS_RE = re.compile(r'[6-9]\d{9}|91\d{10}')  # whole message, digits only
+PHONE_RE = re.compile(r'[6-9]\d{9}')  # embedded, e.g. "my number is 9876543214"
+
+
+class _DigitFilter(dict):
+    """str.translate table that drops everything except decimal digits, filled on first sight"""
+    
+    def __missing__(self, code: int):
+        value = code if chr(code).isdecimal() else None
+        self[code] = value
+        return value
+
+
+DIGITS_ONLY = _DigitFilter()
+
+# Substring guards checked before routing a message, by category
+GUARD_CATEGORIES = {
+    "help": ('help', 'what can you do', 'how does this work', 'guide', 'instructions'),
+    "abuse": ('fuck', 'shit', 'bastard', 'idiot', 'stupid', 'chutiya', 'madarchod')
+}
+
+GUARD_AUTOMATON = _build_automaton({
+    keyword: category
+    for category, keywords in GUARD_CATEGORIES.items()
+    for keyword in keywords
+})
+
+# Without pyahocorasick: one alternation whose named groups are the categories
+GUARD_RE = re.compile('|'.join(
+    f'(?P<{category}>{_keyword_pattern(keywords).pattern})'
+    for category, keywords in GUARD_CATEGORIES.items()
+))
+
+
+def _match_guards(lowered: str) -> frozenset:
+    """Return the guard categories present in a lowercased message"""
+    if GUARD_AUTOMATON is not None:
+        return frozenset(category for _, category in GUARD_AUTOMATON.iter(lowered))
+    return frozenset(match.lastgroup for match in GUARD_RE.finditer(lowered))
+
+
+# Number with optional decimal and optional unit suffix
+NUMBER_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(crores?|cr|lakhs?|lacs?|l|k)?')
+
+UNIT_MULTIPLIERS = {
+    'crore': 10000000, 'crores': 10000000, 'cr': 10000000,
+    'lakh': 100000, 'lakhs': 100000, 'lac': 100000, 'lacs': 100000, 'l': 100000,
+    'k': 1000
+}
 
 def _extract_number(text: str):
     """Extract number with support for k, lakh, crore suffixes"""
     text = text.lower().replace(',', '')
     
-    # Pattern for number with optional decimal and suffix
-    patterns = [
-        (r'(\d+(?:\.\d+)?)\s*(?:crore|crores|cr)', 10000000),  # crores
-        (r'(\d+(?:\.\d+)?)\s*(?:lakh|lakhs|lac|lacs|l)', 100000),  # lakhs
-        (r'(\d+(?:\.\d+)?)\s*k', 1000),  # thousands (k)
-        (r'(\d+(?:\.\d+)?)', 1)  # plain number
-    ]
-    
-    for pattern, multiplier in patterns:
-        match = re.search(pattern, text)
-        if match:
-            number = float(match.group(1))
-            return int(number * multiplier)
+    # One scan; a crore amount anywhere wins over lakhs, lakhs over k, k over a plain number
+    best = None
+    for match in NUMBER_PATTERN.finditer(text):
+        multiplier = UNIT_MULTIPLIERS.get(match.group(2), 1)
+        if best is None or multiplier > best[0]:
+            best = (multiplier, float(match.group(1)))
+            if multiplier == 10000000:
+                break
     
-    return None
+    if best is None:
+        return None
+    multiplier, number = best
+    return int(number * multiplier)
 
 class MasterAgent(BaseAgent):
     """Master agent that orchestrates the entire loan conversation"""
     
     def __init__(self):
         super().__init__("Master Agent")
-        self.sales_agent = SalesAgent()
-        self.verification_agent = VerificationAgent()
-        self.underwriting_agent = UnderwritingAgent()
-        self.pdf_service = PDFService()
         self.state_manager = ConversationStateManager()
-
+        
+        # Sessions waiting to be written, coalesced per session_id
+        self._dirty = {}
+        self._flushing = {}
+        self._pending_history = []
+        
+        # session_id -> (cached_at, context, snapshot digest), least recently used first
+        self._session_cache = OrderedDict()
+        self._dirty_lock = asyncio.Lock()
+        self._flush_wakeup = asyncio.Event()
+        self._flush_task = None
+        self._flush_stopping = False
+        
+        # One turn at a time per session; locks disappear once no turn holds them
+        self._session_locks = weakref.WeakValueDictionary()
+        
+        # Fire-and-forget work; referenced here so tasks aren't collected mid-flight
+        self._bg_tasks = set()
+        
+        # session_id -> sanction letter render still in flight
+        self._pending_letters = {}
+        # session_id -> apology for a letter that failed to render, oldest first
+        self._failed_letters = OrderedDict()
+        
+        # Stage -> handler dispatch; unlisted stages fall through to _handle_completed_stage
+        self._stage_handlers = {
+            ChatStage.GREETING: self._handle_greeting,
+            ChatStage.SALES: self._handle_sales_stage,
+            ChatStage.VERIFICATION: self._handle_verification_stage,
+            ChatStage.UNDERWRITING: self._handle_underwriting_stage,
+            ChatStage.SALARY_SLIP: self._handle_salary_slip_stage,
+            ChatStage.DECISION: self._handle_decision_stage
+        }
         
         # Greeting messages
+        self._rng = random.Random()
         self.greeting_messages = [
             "Welcome to QuickLoan! 🎉 I'm your personal loan assistant.",
             "Hello! I'm here to help you get the perfect personal loan in minutes!",
@@ -58,17 +329,60 @@ class MasterAgent(BaseAgent):
             "Welcome! I'm your AI loan expert, here to make borrowing simple and fast."
         ]
     
+    # Sub-agents are built on first use, so greeting-only sessions never construct them
+    @cached_property
+    def sales_agent(self):
+        from app.agents.sales_agent import SalesAgent
+        return SalesAgent()
+    
+    @cached_property
+    def verification_agent(self):
+        from app.agents.verification_agent import VerificationAgent
+        return VerificationAgent()
+    
+    @cached_property
+    def underwriting_agent(self):
+        from app.agents.underwriting_agent import UnderwritingAgent
+        return UnderwritingAgent()
+    
+    @cached_property
+    def pdf_service(self):
+        from app.services.pdf_service import PDFService
+        return PDFService()
+    
     async def process(self, message: str, session_id: str = None, phone: str = None) -> ChatResponse:
         """Main processing method that routes to appropriate agents"""
         
+        if not session_id:
+            return await self._process_turn(message, session_id, phone)
+        
+        # Serialize turns on the same session so the later one sees the earlier one's state
+        async with self._session_lock(session_id):
+            return await self._process_turn(message, session_id, phone)
+    
+    def _session_lock(self, session_id: str) -> asyncio.Lock:
+        """Lock guarding a session's turns"""
+        
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
+    
+    async def _process_turn(self, message: str, session_id: str = None, phone: str = None) -> ChatResponse:
+        """Handle one user message"""
+        
         # Initialize or load session
         context = await self._get_or_create_session(session_id, phone)
+        now = datetime.now(timezone.utc)
         
         # Handle edge cases and validate input
         message = message.strip()
+        mlen = len(message)
+        lowered = message.lower()
         
         # Check for empty or very short messages
-        if len(message) < 1:
+        if not mlen:
             return self._generate_response(
                 session_id=context.session_id,
                 message="I didn't receive any message. Could you please type your response?",
@@ -77,7 +391,7 @@ class MasterAgent(BaseAgent):
             )
         
         # Check for very long messages (potential spam/abuse)
-        if len(message) > 2000:
+        if mlen > 2000:
             return self._generate_response(
                 session_id=context.session_id,
                 message="Your message is too long. Please keep it under 2000 characters. Let me know what you need!",
@@ -86,8 +400,7 @@ class MasterAgent(BaseAgent):
             )
         
         # Handle common exit/quit commands
-        exit_keywords = ['quit', 'exit', 'bye', 'goodbye', 'close', 'end chat', 'stop']
-        if message.lower() in exit_keywords:
+        if lowered in EXIT_KEYWORDS:
             return self._generate_response(
                 session_id=context.session_id,
                 message="Thank you for visiting QuickLoan! If you'd like to apply for a loan in the future, "
@@ -97,26 +410,20 @@ class MasterAgent(BaseAgent):
                 final=True
             )
         
+        # Help and abuse keywords are found in a single pass over the message
+        guards = _match_guards(lowered)
+        
         # Handle help requests
-        help_keywords = ['help', 'what can you do', 'how does this work', 'guide', 'instructions']
-        if any(keyword in message.lower() for keyword in help_keywords):
+        if "help" in guards:
             return self._generate_response(
                 session_id=context.session_id,
-                message="I'm your QuickLoan AI Assistant! Here's how I can help:\n\n"
-                       "💰 *Loan Application*: I'll guide you through the entire process\n"
-                       "📝 *Requirements*: Just tell me loan amount, tenure, and purpose\n"
-                       "✅ *Instant Approval*: Credit check and approval in minutes\n"
-                       "📄 *Documents*: Minimal documentation needed\n"
-                       "💳 *Disbursement*: Funds in 24-48 hours\n\n"
-                       "I'll ask you questions step by step. Just answer naturally!\n\n"
-                       "Ready to start? Tell me how much loan you need!",
+                message=HELP_MESSAGE,
                 stage=context.current_stage,
                 requires_input=True
             )
         
         # Handle abuse/inappropriate content
-        abuse_keywords = ['fuck', 'shit', 'bastard', 'idiot', 'stupid', 'chutiya', 'madarchod']
-        if any(keyword in message.lower() for keyword in abuse_keywords):
+        if "abuse" in guards:
             return self._generate_response(
                 session_id=context.session_id,
                 message="I'm here to help you with your loan application. Please keep the conversation professional. "
@@ -126,17 +433,12 @@ class MasterAgent(BaseAgent):
             )
         
         # Add message to conversation history
-        context.conversation_history.append({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "sender": "user",
-            "message": message
-        })
+        self._append_history(context, "user", message, now)
         
         # Check if we're awaiting purpose selection (mid-conversation purpose change)
-        if hasattr(context, 'metadata') and context.metadata and \
-           context.metadata.get('awaiting_purpose_selection'):
+        if context.metadata.get('awaiting_purpose_selection'):
             # Extract purpose from the message
-            purpose = self.sales_agent._extract_purpose(message)
+            purpose = self.sales_agent._extract_purpose(message, lowered)
             
             if purpose:
                 # Update the purpose
@@ -186,14 +488,12 @@ class MasterAgent(BaseAgent):
                 )
         
         # 🔄 Conversational flexibility: mid-flow corrections
-        updates = await self._handle_mid_conversation_update(message, context)
+        updates = await self._handle_mid_conversation_update(message, context, lowered)
 
         if updates:
             # Check if user wants to show purpose options
             if "loan_purpose" in updates and updates["loan_purpose"] == "SHOW_OPTIONS":
                 # Set a flag in metadata to indicate we're waiting for purpose selection
-                if not hasattr(context, 'metadata') or context.metadata is None:
-                    context.metadata = {}
                 context.metadata['awaiting_purpose_selection'] = True
                 
                 # Clear the loan_request purpose
@@ -230,9 +530,6 @@ class MasterAgent(BaseAgent):
                 purpose_display = context.loan_request.purpose.value.replace('_', ' ').title()
                 update_msg += f"🎯 Purpose: {purpose_display}\n"
             update_msg += "\n"
-            
-            # Persist updated context
-            await self._save_session(context)
 
             # 🔁 Resume flow automatically from correct agent
             if context.current_stage == ChatStage.SALES:
@@ -255,33 +552,15 @@ class MasterAgent(BaseAgent):
             # Prepend update acknowledgement
             response.message = update_msg + response.message
 
-            # Save again after agent response
+            # Persist the updated details together with the agent's response
             await self._save_session(context)
             response.session_id = context.session_id
             return response
 
 
         # Route to appropriate agent based on current stage
-        if context.current_stage == ChatStage.GREETING:
-            response = await self._handle_greeting(message, context)
-        elif context.current_stage == ChatStage.SALES:
-            response = await self.sales_agent.process(message, context)
-        elif context.current_stage == ChatStage.VERIFICATION:
-            response = await self.verification_agent.process(message, context)
-            
-            # Auto-trigger underwriting after verification
-            if response.stage == ChatStage.UNDERWRITING and not response.requires_input:
-                context.current_stage = ChatStage.UNDERWRITING
-                response = await self.underwriting_agent.process(message, context)
-                
-        elif context.current_stage == ChatStage.UNDERWRITING:
-            response = await self.underwriting_agent.process(message, context)
-        elif context.current_stage == ChatStage.SALARY_SLIP:
-            response = await self._handle_salary_slip_stage(message, context)
-        elif context.current_stage == ChatStage.DECISION:
-            response = await self._handle_decision_stage(message, context)
-        else:
-            response = await self._handle_completed_stage(message, context)
+        handler = self._stage_handlers.get(context.current_stage, self._handle_completed_stage)
+        response = await handler(message, context)
         
         # 🔧 Normalize stage to ChatStage enum
         if isinstance(response.stage, str):
@@ -295,11 +574,7 @@ class MasterAgent(BaseAgent):
 
         
         # Add response to conversation history
-        context.conversation_history.append({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "sender": "assistant",
-            "message": response.message
-        })
+        self._append_history(context, "assistant", response.message, now)
         
         # Save session
         await self._save_session(context)
@@ -312,8 +587,6 @@ class MasterAgent(BaseAgent):
     async def _handle_greeting(self, message: str, context: ConversationContext) -> ChatResponse:
         """Handle initial greeting and introduction with AI intelligence"""
         
-        import random
-        
         # Try to get AI response if available
         ai_response = await ai_service.get_intelligent_response(
             user_message=message,
@@ -334,17 +607,7 @@ class MasterAgent(BaseAgent):
             )
         
         # Fallback to rule-based greeting
-        greeting = random.choice(self.greeting_messages)
-        
-        response_message = (
-            f"{greeting}\n\n"
-            "I can help you get a personal loan of ₹10,000 to ₹50,00,000 with:\n"
-            "✅ Instant approval in minutes\n"
-            "✅ Competitive interest rates\n"
-            "✅ Flexible repayment options\n"
-            "✅ Minimal documentation\n\n"
-            "Let's start! How much loan amount do you need?"
-        )
+        response_message = self._rng.choice(self.greeting_messages) + GREETING_SUFFIX
         
         return self._generate_response(
             session_id=context.session_id,
@@ -352,23 +615,26 @@ class MasterAgent(BaseAgent):
             stage=ChatStage.SALES,
             requires_input=True
         )
+    
+    async def _handle_sales_stage(self, message: str, context: ConversationContext) -> ChatResponse:
+        """Collect loan requirements"""
+        return await self.sales_agent.process(message, context)
+    
+    async def _handle_verification_stage(self, message: str, context: ConversationContext) -> ChatResponse:
+        """Verify the customer, moving straight on to underwriting once KYC passes"""
         
-        response_message = (
-            f"{greeting}\n\n"
-            "I can help you get a personal loan of ₹10,000 to ₹50,00,000 with:\n"
-            "✅ Instant approval in minutes\n"
-            "✅ Competitive interest rates\n"
-            "✅ Flexible repayment options\n"
-            "✅ Minimal documentation\n\n"
-            "Let's start! How much loan amount do you need?"
-        )
+        response = await self.verification_agent.process(message, context)
         
-        return self._generate_response(
-            session_id=context.session_id,
-            message=response_message,
-            stage=ChatStage.SALES,
-            requires_input=True
-        )
+        # Verified customers go straight to underwriting; the verified context is all it needs
+        if response.metadata.get("auto_transition") == ChatStage.UNDERWRITING.value:
+            context.current_stage = ChatStage.UNDERWRITING
+            response = await self.underwriting_agent.process_verified(context)
+        
+        return response
+    
+    async def _handle_underwriting_stage(self, message: str, context: ConversationContext) -> ChatResponse:
+        """Run the credit assessment"""
+        return await self.underwriting_agent.process(message, context)
     
     async def _handle_salary_slip_stage(self, message: str, context: ConversationContext) -> ChatResponse:
         """Handle salary slip upload and verification"""
@@ -379,7 +645,8 @@ class MasterAgent(BaseAgent):
         dummy_services = DummyServices()
         
         # Simulate salary slip processing
-        if any(word in message.lower() for word in ['upload', 'file', 'slip', 'salary', 'uploaded', 'attached']):
+        lowered = message.lower()
+        if any(word in lowered for word in SALARY_SLIP_KEYWORDS):
             # Get customer salary from database (for simulation)
             customer_phone = context.customer_phone
             salary = context.customer_data.get('salary', 50000)  # Default fallback
@@ -400,61 +667,41 @@ class MasterAgent(BaseAgent):
     async def _handle_decision_stage(self, message: str, context: ConversationContext) -> ChatResponse:
         """Handle final decision and sanction letter generation"""
         
-        if any(word in message.lower() for word in ['yes', 'email', 'send', 'generate', 'sanction']):
-            # Generate sanction letter
-            try:
-                sanction_letter = await self._generate_sanction_letter(context)
-                
-                customer_name = context.customer_data.get('name', 'Customer')
-                
-                return self._generate_response(
-                    session_id=context.session_id,
-                    message=f"🎉 Perfect! Your sanction letter has been generated successfully!\n\n"
-                           f"*Sanction Letter Details:*\n"
-                           f"📄 Document: Loan Sanction Letter\n"
-                           f"👤 Customer: {customer_name}\n"
-                           f"💰 Amount: ₹{context.underwriting_result.loan_amount:,.0f}\n"
-                           f"📅 Tenure: {context.underwriting_result.tenure} months\n"
-                           f"💳 EMI: ₹{context.underwriting_result.emi:,.0f}\n\n"
-                           f"The sanction letter has been saved and is ready for download.\n\n"
-                           f"*Next Steps:*\n"
-                           f"1. Download and review your sanction letter\n"
-                           f"2. Our team will contact you within 24 hours\n"
-                           f"3. Complete final documentation\n"
-                           f"4. Get funds disbursed to your account\n\n"
-                           f"Thank you for choosing QuickLoan! 🙏",
-                    stage=ChatStage.COMPLETED,
-                    requires_input=False,
-                    final=True
-                )
-                
-            except Exception as e:
-                return self._generate_response(
-                    session_id=context.session_id,
-                    message=f"I apologize, but there was an issue generating your sanction letter. "
-                           f"Don't worry - your loan is still approved! Our team will email you "
-                           f"the sanction letter within 1 hour.\n\n"
-                           f"Your loan reference number is: QL{context.session_id[:8].upper()}\n\n"
-                           f"Thank you for choosing QuickLoan! 🙏",
-                    stage=ChatStage.COMPLETED,
-                    requires_input=False,
-                    final=True
-                )
+        lowered = message.lower()
+        if any(word in lowered for word in SANCTION_CONFIRM_KEYWORDS):
+            # Render the letter in the background; the download endpoint waits for it
+            self._start_sanction_letter(context)
+            
+            customer_name = context.customer_data.get('name', 'Customer')
+            result = context.underwriting_result
+            
+            return self._generate_response(
+                session_id=context.session_id,
+                message=SANCTION_GENERATED_TEMPLATE.substitute(
+                    name=customer_name,
+                    amount=f"{result.loan_amount:,.0f}",
+                    tenure=result.tenure,
+                    emi=f"{result.emi:,.0f}"
+                ),
+                stage=ChatStage.COMPLETED,
+                requires_input=False,
+                final=True,
+                metadata={"sanction_letter_url": f"/api/download-sanction-letter/{context.session_id}"}
+            )
         else:
             customer_name = context.customer_data.get('name', 'Customer')
+            result = context.underwriting_result
             
             return self._generate_response(
                 session_id=context.session_id,
-                message=f"No problem, {customer_name}! Here's a summary of your approved loan:\n\n"
-                       f"*Final Loan Details:*\n"
-                       f"✅ *Approved Amount*: ₹{context.underwriting_result.loan_amount:,.0f}\n"
-                       f"✅ *Tenure*: {context.underwriting_result.tenure} months\n"
-                       f"✅ *EMI*: ₹{context.underwriting_result.emi:,.0f}\n"
-                       f"✅ *Interest Rate*: {context.underwriting_result.interest_rate}% p.a.\n"
-                       f"✅ *Loan Reference*: QL{context.session_id[:8].upper()}\n\n"
-                       f"Our team will contact you within 24 hours to complete the documentation "
-                       f"and disburse the funds to your account.\n\n"
-                       f"Thank you for choosing QuickLoan! 🙏",
+                message=_decision_summary(
+                    customer_name,
+                    result.loan_amount,
+                    result.tenure,
+                    result.emi,
+                    result.interest_rate,
+                    _loan_reference(context.session_id)
+                ),
                 stage=ChatStage.COMPLETED,
                 requires_input=False,
                 final=True
@@ -463,11 +710,15 @@ class MasterAgent(BaseAgent):
     async def _handle_completed_stage(self, message: str, context: ConversationContext) -> ChatResponse:
         """Handle messages after loan process is completed"""
         
+        # A sanction letter that failed to render after the decision turn is reported once
+        if context.metadata.pop("sanction_letter_failed", False):
+            message = SANCTION_FAILED_TEMPLATE.substitute(ref=_loan_reference(context.session_id))
+        else:
+            message = COMPLETED_MESSAGE
+        
         return self._generate_response(
             session_id=context.session_id,
-            message="Thank you for using QuickLoan! Your loan application has been completed. "
-                   "If you need any assistance or have questions, please feel free to start a new conversation.\n\n"
-                   "Have a great day! 😊",
+            message=message,
             stage=ChatStage.COMPLETED,
             requires_input=False,
             final=True
@@ -477,12 +728,31 @@ class MasterAgent(BaseAgent):
         """Get existing session or create new one"""
         
         if session_id:
-            # Try to load existing session
-            db = SessionLocal()
+            # Sessions not yet flushed are newer than their database rows
+            pending = self._dirty.get(session_id) or self._flushing.get(session_id)
+            if pending is not None:
+                return pending
+            
+            cached = self._get_cached_session(session_id)
+            if cached is not None:
+                return cached
+            
+            # Try to load existing session; its row and history tail are fetched concurrently
             try:
-                session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
+                rows, history_rows = await asyncio.gather(
+                    self._read(select(ChatSession.id, ChatSession.context).where(ChatSession.session_id == session_id)),
+                    self._read(self._history_tail_query(session_id))
+                )
+                session = rows[0] if rows else None
                 if session:
-                    context_data = json.loads(session.context) if session.context else {}
+                    # An expired cache entry is still good if the stored snapshot hasn't changed
+                    digest = _snapshot_digest(session.context)
+                    entry = self._session_cache.get(session_id)
+                    if entry is not None and digest is not None and entry[2] == digest:
+                        self._cache_session(entry[1], digest)
+                        return entry[1]
+                    
+                    context_data = serialization.unpack(session.context) if session.context else {}
                     context = ConversationContext(**context_data)
 
                     # 🔧 FIX: ensure current_stage is ChatStage enum
@@ -493,12 +763,12 @@ class MasterAgent(BaseAgent):
                             context.current_stage = ChatStage.GREETING
 
                     context.session_id = session_id
+                    self._apply_history_tail(context, history_rows)
+                    self._cache_session(context, digest)
                     return context
 
             except Exception as e:
-                print(f"Error loading session: {e}")
-            finally:
-                db.close()
+                logger.error(f"Error loading session: {e}", exc_info=True)
         
         # Create new session
         new_session_id = str(uuid.uuid4())
@@ -508,18 +778,135 @@ class MasterAgent(BaseAgent):
             current_stage=ChatStage.GREETING,
             conversation_history=[]
         )
+        context.conversation_history = deque(maxlen=HISTORY_TAIL_LIMIT)
+        
+        # Nothing in this turn reads the state manager's copy, so don't wait for it
+        self._spawn(self.state_manager.initialize_conversation(context.session_id))
+        return context
+    
+    def _spawn(self, coro):
+        """Run a coroutine in the background, logging any failure"""
         
-        await self.state_manager.initialize_conversation(context.session_id)
+        task = asyncio.create_task(coro)
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_task_done)
+    
+    def _bg_task_done(self, task: asyncio.Task):
+        """Forget a finished background task and report its error"""
+        
+        self._bg_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background task failed: {task.exception()}", exc_info=task.exception())
+    
+    def _get_cached_session(self, session_id: str):
+        """Return a cached context that hasn't expired, or None"""
+        
+        entry = self._session_cache.get(session_id)
+        if entry is None:
+            return None
+        
+        cached_at, context, _ = entry
+        if time.monotonic() - cached_at > SESSION_CACHE_TTL:
+            # Kept so the next database read can revalidate it by digest
+            return None
+        
+        self._session_cache.move_to_end(session_id)
         return context
     
+    def _cache_session(self, context: ConversationContext, digest: bytes = None):
+        """Remember a context, dropping expired and least recently used entries"""
+        
+        now = time.monotonic()
+        self._session_cache[context.session_id] = (now, context, digest)
+        self._session_cache.move_to_end(context.session_id)
+        if len(self._session_cache) > SESSION_CACHE_SIZE:
+            self._session_cache.popitem(last=False)
+        
+        # Idle entries collect at the cold end; drop them so abandoned sessions don't linger
+        while self._session_cache:
+            cached_at, _, _ = next(iter(self._session_cache.values()))
+            if now - cached_at <= SESSION_CACHE_MAX_IDLE:
+                break
+            self._session_cache.popitem(last=False)
+    
+    def _append_history(self, context: ConversationContext, sender: str, message: str, timestamp: datetime):
+        """Add a message to the in-memory tail and queue it for the history log"""
+        
+        turn_index = context._history_turns
+        context._history_turns = turn_index + 1
+        
+        context.conversation_history.append({
+            "timestamp": timestamp,
+            "sender": sender,
+            "message": message
+        })
+        self._pending_history.append({
+            "session_id": context.session_id,
+            "turn_index": turn_index,
+            "sender": sender,
+            "message": message,
+            "created_at": timestamp
+        })
+    
+    @staticmethod
+    def _history_tail_query(session_id: str):
+        """Last HISTORY_TAIL_LIMIT logged messages of a session, newest first"""
+        
+        return (
+            select(
+                ConversationHistoryEntry.turn_index,
+                ConversationHistoryEntry.sender,
+                ConversationHistoryEntry.message,
+                ConversationHistoryEntry.created_at
+            )
+            .where(ConversationHistoryEntry.session_id == session_id)
+            .order_by(ConversationHistoryEntry.turn_index.desc())
+            .limit(HISTORY_TAIL_LIMIT)
+        )
+    
+    @staticmethod
+    def _apply_history_tail(context: ConversationContext, rows: list):
+        """Page logged messages back onto a loaded context"""
+        
+        if rows:
+            context._history_turns = rows[0].turn_index + 1
+            context.conversation_history = deque(
+                (
+                    {"timestamp": row.created_at, "sender": row.sender, "message": row.message}
+                    for row in reversed(rows)
+                ),
+                maxlen=HISTORY_TAIL_LIMIT
+            )
+        else:
+            # Snapshots written before history moved to its own table still carry their tail
+            context.conversation_history = deque(context.conversation_history, maxlen=HISTORY_TAIL_LIMIT)
+    
+    async def _read(self, stmt) -> list:
+        """Run a read-only query, using the async pool when available"""
+        
+        if AsyncSessionMaker is not None:
+            async with AsyncSessionMaker() as db:
+                return (await db.execute(stmt)).all()
+        
+        # Without aiosqlite, keep the blocking query off the event loop
+        return await asyncio.to_thread(self._read_sync, stmt)
+    
+    @staticmethod
+    def _read_sync(stmt) -> list:
+        """Blocking fallback for _read"""
+        
+        with SessionLocal() as db:
+            return db.execute(stmt).all()
+    
     from app.models.schemas import LoanRequest
 
     async def _handle_mid_conversation_update(
         self,
         message: str,
-        context: ConversationContext
+        context: ConversationContext,
+        msg_lower: str = None
     ):
-        msg = message.lower()
+        msg = msg_lower if msg_lower is not None else message.lower()
         updates = {}
 
         # 🔒 If loan_request doesn't exist yet → this is INITIAL data entry
@@ -529,38 +916,22 @@ class MasterAgent(BaseAgent):
         
         # 🚫 Skip update detection if in VERIFICATION stage and message looks like phone number
         if context.current_stage == ChatStage.VERIFICATION:
-            # Check if message contains a valid Indian phone number pattern
-            digits_only = re.sub(r'\D', '', message)
-            
-            # Check for 10-digit phone starting with 6-9
-            if len(digits_only) == 10 and digits_only[0] in '6789':
+            # A 10-digit number starting with 6-9, optionally with the 91 country code
+            if PHONE_DIGITS_RE.fullmatch(message.translate(DIGITS_ONLY)):
                 return None  # This is a phone number, not an update
             
-            # Check for phone patterns with country code
-            if len(digits_only) == 12 and digits_only.startswith('91'):
-                return None  # Phone with +91 prefix
-            
-            # Check if message contains a 10-digit sequence starting with 6-9 (handles "my number is 9876543214")
-            phone_match = re.search(r'[6-9]\d{9}', message)
-            if phone_match:
+            # Check if message contains a 10-digit sequence starting with 6-9
+            if PHONE_RE.search(message):
                 return None  # Contains a phone number pattern
 
         # ---------------- TENURE CHANGE (only if already set) ----------------
         if context.loan_request.tenure:
-            # Common typos for month/year
-            tenure_keywords = ["month", "months", "minths", "monts", "mnths", "mth", "mths", 
-                             "year", "years", "yrs", "yr", "yeras", "yrs"]
-            tenure_change_keywords = ["change tenure", "change loan tenure", "update tenure", "modify tenure"]
-            
             # Check if message contains tenure-related keywords or explicit change request
-            has_tenure_keyword = any(kw in msg for kw in tenure_keywords)
-            has_tenure_change = any(kw in msg for kw in tenure_change_keywords)
-            
-            if has_tenure_keyword or has_tenure_change:
+            if TENURE_RE.search(msg):
                 num = _extract_number(msg)
                 if num:
                     # Detect if it's years (convert to months)
-                    is_years = any(kw in msg for kw in ["year", "years", "yrs", "yr", "yeras"])
+                    is_years = YEAR_RE.search(msg) is not None
                     new_tenure = num * 12 if is_years else num
                     
                     # Only update if different
@@ -569,97 +940,45 @@ class MasterAgent(BaseAgent):
 
         # ---------------- AMOUNT CHANGE (only if already set) ----------------
         if context.loan_request.amount:
-            # Check for explicit amount change keywords OR amount-related words
-            amount_keywords = ["loan", "amount", "₹", "rs", "rupees", "lakh", "lakhs", "crore", "crores", 
-                              "thousand", "k", "l", "cr", "need", "want", "require"]
-            
-            # Also check if message contains amount indicators like "lakh/crore/k"
-            has_amount_indicator = any(w in msg for w in amount_keywords)
-            
-            if has_amount_indicator:
+            # Check for explicit amount change keywords OR amount indicators like "lakh/crore/k"
+            if AMOUNT_RE.search(msg):
                 # Try to extract the new amount
                 num = _extract_number(msg)
                 if num and num >= 10000 and num != context.loan_request.amount:
                     updates["loan_amount"] = num
 
         # ---------------- PURPOSE CHANGE (only if already set) ----------------
-        # First check if user wants to change purpose (even if keyword doesn't match)
-        purpose_change_keywords = ["change purpose", "change loan purpose", "different purpose", "modify purpose", "update purpose"]
-        purpose_inquiry_keywords = ["what are", "show me", "which", "available", "list", "options", "types of"]
-        # Common typos of "purpose"
-        purpose_typos = ["purpose", "purose", "purpse", "purposs", "porpose", "purpos", "perpus", "perpuse"]
-        
         # Check if user is asking about available purposes or wants to change
         if context.loan_request.purpose:
             # Check for explicit purpose change keywords
-            if any(kw in msg for kw in purpose_change_keywords):
+            if PURPOSE_CHANGE_RE.search(msg):
                 updates["loan_purpose"] = "SHOW_OPTIONS"  # Flag to show options
             # Check if asking about purposes
-            elif any(kw in msg for kw in purpose_inquiry_keywords) and any(typo in msg for typo in purpose_typos):
+            elif PURPOSE_INQUIRY_RE.search(msg) and PURPOSE_TYPO_RE.search(msg):
                 # User is asking "what are various loan purposes" or similar
                 updates["loan_purpose"] = "SHOW_OPTIONS"
             # Check if they're trying to say "loan purpose <something>" with typo
-            elif "loan" in msg and any(typo in msg for typo in purpose_typos):
+            elif "loan" in msg and PURPOSE_TYPO_RE.search(msg):
                 # Likely trying to change purpose, show options
                 updates["loan_purpose"] = "SHOW_OPTIONS"
             # Only check for specific purpose keywords if we haven't already flagged for SHOW_OPTIONS
             else:
-                purpose_map = {
-                "wedding": LoanPurpose.WEDDING,
-                "marriage": LoanPurpose.WEDDING,
-                "shaadi": LoanPurpose.WEDDING,
-                "education": LoanPurpose.EDUCATION,
-                "study": LoanPurpose.EDUCATION,
-                "edu": LoanPurpose.EDUCATION,
-                "business": LoanPurpose.BUSINESS,
-                "startup": LoanPurpose.BUSINESS,
-                "medical": LoanPurpose.MEDICAL,
-                "health": LoanPurpose.MEDICAL,
-                "hospital": LoanPurpose.MEDICAL,
-                "travel": LoanPurpose.TRAVEL,
-                "vacation": LoanPurpose.TRAVEL,
-                "trip": LoanPurpose.TRAVEL,
-                "personal": LoanPurpose.PERSONAL,
-                "home": LoanPurpose.HOME_IMPROVEMENT,
-                "house": LoanPurpose.HOME_IMPROVEMENT,
-                "renovation": LoanPurpose.HOME_IMPROVEMENT,
-                "repair": LoanPurpose.HOME_IMPROVEMENT,
-                "improvement": LoanPurpose.HOME_IMPROVEMENT,
-                "debt": LoanPurpose.DEBT_CONSOLIDATION,
-                "consolidation": LoanPurpose.DEBT_CONSOLIDATION,
-                "loan closure": LoanPurpose.DEBT_CONSOLIDATION,
-                "payoff": LoanPurpose.DEBT_CONSOLIDATION
-                }
-                for key, purpose_value in purpose_map.items():
-                    if key in msg:
-                        # Check if it's actually different from current purpose
-                        if purpose_value != context.loan_request.purpose:
-                            updates["loan_purpose"] = purpose_value
-                            break
+                # Only a purpose that differs from the current one counts as a change
+                purpose_value = match_purpose(msg, edits_only=True, exclude=context.loan_request.purpose)
+                if purpose_value:
+                    updates["loan_purpose"] = purpose_value
 
         # 🚫 Nothing actually changed → continue normal flow
         if not updates:
             return None
 
         # ---------------- INTELLIGENT STAGE ROLLBACK ----------------
-        if context.current_stage == ChatStage.VERIFICATION:
-            target_stage = ChatStage.SALES
-        elif context.current_stage == ChatStage.UNDERWRITING:
-            target_stage = ChatStage.VERIFICATION
-        elif context.current_stage == ChatStage.DECISION:
-            target_stage = ChatStage.UNDERWRITING
-        else:
-            target_stage = context.current_stage
+        target_stage = ROLLBACK_STAGES.get(context.current_stage, context.current_stage)
 
         # ---------------- APPLY UPDATES SAFELY ----------------
-        if "loan_amount" in updates:
-            context.loan_request.amount = updates["loan_amount"]
-
-        if "loan_tenure" in updates:
-            context.loan_request.tenure = updates["loan_tenure"]
-
-        if "loan_purpose" in updates:
-            context.loan_request.purpose = updates["loan_purpose"]
+        for key, attr in UPDATE_FIELDS:
+            if key in updates:
+                setattr(context.loan_request, attr, updates[key])
 
         # ---------------- STATE MANAGER TRANSITION ----------------
         await self.state_manager.transition_stage(
@@ -675,38 +994,196 @@ class MasterAgent(BaseAgent):
 
 
     async def _save_session(self, context: ConversationContext):
-        """Save session to database"""
+        """Queue session for the background flush"""
+        
+        async with self._dirty_lock:
+            self._dirty[context.session_id] = context
+            pending = len(self._dirty)
+        
+        if not self._flush_stopping and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if pending >= FLUSH_BATCH_SIZE:
+            self._flush_wakeup.set()
+    
+    async def _flush_loop(self):
+        """Flush queued sessions every interval, or sooner once a batch fills up"""
+        
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), DEFAULT_FLUSH_INTERVAL_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            if self._flush_stopping:
+                return
+            
+            # A failed batch is queued again by _flush_dirty, so keep looping and retry it
+            try:
+                await self._flush_dirty()
+            except Exception as e:
+                logger.error(f"Error flushing sessions: {e}", exc_info=True)
+    
+    async def _flush_dirty(self):
+        """Write all queued sessions in one transaction"""
+        
+        async with self._dirty_lock:
+            if not self._dirty and not self._pending_history:
+                return
+            self._flushing, self._dirty = self._dirty, {}
+            history, self._pending_history = self._pending_history, []
         
-        db = SessionLocal()
+        written = False
         try:
-            # Convert context to dict for JSON storage
-            context_dict = context.dict()
-            context_json = json.dumps(context_dict, default=str)
+            # Dump on the event loop so contexts are not mutated mid-dump; packing the
+            # independent copies can then happen on a worker thread
+            packed = await asyncio.to_thread(self._pack_snapshots, {
+                session_id: self._snapshot_fields(context)
+                for session_id, context in self._flushing.items()
+            })
             
-            # Update or create session
-            session = db.query(ChatSession).filter(ChatSession.session_id == context.session_id).first()
+            rows = []
+            for session_id, context in self._flushing.items():
+                snapshot, digest = packed[session_id]
+                
+                # Turns that only added messages leave the stored snapshot as it is
+                entry = self._session_cache.get(session_id)
+                if entry is not None and entry[2] == digest:
+                    continue
+                rows.append({
+                    "session_id": session_id,
+                    "customer_phone": context.customer_phone,
+                    "current_stage": context.current_stage.value,
+                    "context": snapshot
+                })
             
-            if session:
-                session.customer_phone = context.customer_phone
-                session.current_stage = context.current_stage.value
-                session.context = context_json
-                session.updated_at = datetime.now(timezone.utc)
+            if await self._write_sessions(rows, history):
+                written = True
+                for session_id, context in self._flushing.items():
+                    self._cache_session(context, packed[session_id][1])
+        finally:
+            flushing, self._flushing = self._flushing, {}
+            if not written:
+                # Failed, raised or cancelled: queue the batch again so nothing is lost
+                self._requeue(flushing, history)
+    
+    def _requeue(self, sessions: dict, history: list):
+        """Put an unwritten batch back in the queue; sessions queued since then are newer and win"""
+        
+        for session_id, context in sessions.items():
+            self._dirty.setdefault(session_id, context)
+        self._pending_history = history + self._pending_history
+    
+    @staticmethod
+    def _snapshot_fields(context: ConversationContext) -> dict:
+        """Context fields stored in the session row; history lives in conversation_history rows"""
+        
+        return context.model_dump(exclude={"conversation_history"})
+    
+    @staticmethod
+    def _pack_snapshots(snapshots: dict) -> dict:
+        """Pack and digest dumped contexts by session_id (runs in a worker thread)"""
+        
+        packed = {}
+        for session_id, fields in snapshots.items():
+            snapshot = serialization.pack(fields)
+            packed[session_id] = (snapshot, _snapshot_digest(snapshot))
+        return packed
+    
+    async def _write_sessions(self, rows: list, history: list) -> bool:
+        """Write a batch of session rows and history entries in one transaction"""
+        
+        try:
+            if AsyncSessionMaker is not None:
+                async with AsyncSessionMaker() as db:
+                    await db.run_sync(self._apply_session_rows, rows, history)
+                    await db.commit()
             else:
-                session = ChatSession(
-                    session_id=context.session_id,
-                    customer_phone=context.customer_phone,
-                    current_stage=context.current_stage.value,
-                    context=context_json
-                )
-                db.add(session)
-            
+                await asyncio.to_thread(self._write_sessions_sync, rows, history)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving sessions: {e}", exc_info=True)
+            return False
+    
+    def _write_sessions_sync(self, rows: list, history: list):
+        """Blocking fallback for _write_sessions when aiosqlite is not installed"""
+        
+        with SessionLocal() as db:
+            self._apply_session_rows(db, rows, history)
             db.commit()
+    
+    @staticmethod
+    def _apply_session_rows(db: Session, rows: list, history: list):
+        """Upsert session rows by session_id and append history"""
+        
+        if history:
+            db.bulk_insert_mappings(ConversationHistoryEntry, history)
+        if not rows:
+            return
+        
+        now = datetime.now(timezone.utc)
+        for row in rows:
+            row["updated_at"] = now
+        db.execute(SESSION_UPSERT, rows)
+    
+    async def shutdown_flush(self):
+        """Stop the background flush and write any sessions still queued"""
+        
+        # Let the loop finish a flush already under way rather than cancelling it mid-write
+        self._flush_stopping = True
+        if self._flush_task is not None:
+            self._flush_wakeup.set()
+            await self._flush_task
+            self._flush_task = None
+        
+        # Let sanction letters already being rendered reach disk
+        if self._pending_letters:
+            await asyncio.wait(set(self._pending_letters.values()))
+        
+        await self._flush_dirty()
+    
+    def _start_sanction_letter(self, context: ConversationContext):
+        """Start rendering the sanction letter without holding up the chat turn"""
+        
+        session_id = context.session_id
+        if session_id in self._pending_letters:
+            return
+        
+        task = asyncio.create_task(self._render_sanction_letter(context))
+        self._pending_letters[session_id] = task
+        task.add_done_callback(lambda t: self._letter_done(session_id, t))
+    
+    def _letter_done(self, session_id: str, task: asyncio.Task):
+        """Forget a finished sanction letter render"""
+        
+        if self._pending_letters.get(session_id) is task:
+            del self._pending_letters[session_id]
+    
+    async def _render_sanction_letter(self, context: ConversationContext) -> Optional[str]:
+        """Render the sanction letter, recording a failure for the download endpoint and the next turn"""
+        
+        try:
+            return await self._generate_sanction_letter(context)
+        except Exception:
+            # Already logged by _generate_sanction_letter
+            session_id = context.session_id
+            self._failed_letters[session_id] = SANCTION_FAILED_TEMPLATE.substitute(ref=_loan_reference(session_id))
+            if len(self._failed_letters) > SESSION_CACHE_SIZE:
+                self._failed_letters.popitem(last=False)
             
-        except Exception as e:
-            print(f"Error saving session: {e}")
-            db.rollback()
-        finally:
-            db.close()
+            context.metadata["sanction_letter_failed"] = True
+            await self._save_session(context)
+            return None
+    
+    async def wait_for_sanction_letter(self, session_id: str) -> Optional[str]:
+        """Wait for an in-flight sanction letter render for this session, if any.
+        
+        Returns the apology to show the customer if the letter failed to render, else None.
+        """
+        
+        task = self._pending_letters.get(session_id)
+        if task is not None:
+            await asyncio.wait({task})
+        return self._failed_letters.get(session_id)
     
     async def _generate_sanction_letter(self, context: ConversationContext) -> str:
         """Generate PDF sanction letter"""
@@ -719,5 +1196,5 @@ class MasterAgent(BaseAgent):
             )
             return letter_path
         except Exception as e:
-            print(f"Error generating sanction letter: {e}")
+            logger.error(f"Error generating sanction letter: {e}", exc_info=True)
             raise e
\ No newline at end of file
@@ -3,10 +3,217 @@ Sales Agent - Collects loan requirements and negotiates like a human sales execu
 """
 
 import re
+import functools
 from typing import Optional
 from app.agents.base_agent import BaseAgent
 from app.models.schemas import ConversationContext, ChatResponse, ChatStage, LoanRequest, LoanPurpose
-from app.utils.ai_helper import AIHelper
+from app.utils.ai_helper import ai_helper
+from app.agents.keywords import match_purpose
+
+
+# Menu numbers 1-8 typed on their own or inside a sentence
+PURPOSE_NUMBER_RE = re.compile(r'\b([1-8])\b')
+PURPOSE_NUMBERS = {
+    "1": LoanPurpose.PERSONAL,
+    "2": LoanPurpose.HOME_IMPROVEMENT,
+    "3": LoanPurpose.EDUCATION,
+    "4": LoanPurpose.MEDICAL,
+    "5": LoanPurpose.BUSINESS,
+    "6": LoanPurpose.WEDDING,
+    "7": LoanPurpose.TRAVEL,
+    "8": LoanPurpose.DEBT_CONSOLIDATION
+}
+
+# Amount and tenure patterns as one alternation each, listed in priority order: the first
+# alternative that occurs anywhere in the message wins. The lookahead keeps matches zero-width,
+# so a lower-priority alternative can never swallow the text of a higher-priority one.
+AMOUNT_RE = re.compile(
+    r'(?=(?P<lakh>\d+\.?\d*)\s*lakh'
+    r'|(?P<crore>\d+\.?\d*)\s*crore'
+    r'|(?P<k>\d+\.?\d*)\s*k\b'
+    r'|₹\s*(?P<rupee>\d+\.?\d*)'
+    r'|(?P<digits>\d{4,})'  # Any number with 4+ digits
+    r')'
+)
+TENURE_RE = re.compile(
+    r'(?=(?P<month>\d+)\s*month'
+    r'|(?P<year>\d+)\s*year'
+    r'|(?P<yr>\d+)\s*yr'
+    r'|(?P<mon>\d+)\s*mon'
+    r'|(?P<bare>\d+)(?:\s+months?)?(?:\s+years?)?'
+    r')'
+)
+
+# Replies that accept the amount suggested after a typo
+TYPO_CONFIRM_WORDS = frozenset({'yes', 'yeah', 'yup', 'correct', 'right', 'ok', 'okay', 'confirm'})
+
+# Misspelt amount units and their corrections
+AMOUNT_TYPOS = {
+    'laksh': 'lakh',
+    'laskh': 'lakh',
+    'laks': 'lakh',
+    'lacs': 'lakh',
+    'cror': 'crore',
+    'crors': 'crores'
+}
+AMOUNT_TYPO_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(typo) for typo in sorted(AMOUNT_TYPOS, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+# Multiplier for the AMOUNT_RE alternative that matched; rupee and plain amounts are taken as is
+AMOUNT_UNIT_MULTIPLIERS = {'lakh': 100000, 'crore': 10000000, 'k': 1000}
+
+# Months per unit for the TENURE_RE alternative that matched; bare numbers are months
+TENURE_UNIT_MONTHS = {'year': 12, 'yr': 12}
+
+
+# Static response bodies, built once
+TENURE_QUESTION = (
+    "Now, let me ask about the repayment period. "
+    "What tenure would work best for you? "
+    "We offer flexible options from 6 months to 7 years.\n\n"
+    "Longer tenure = Lower monthly EMI\n"
+    "Shorter tenure = Less total interest\n\n"
+    "What would you prefer?"
+)
+
+MIN_AMOUNT_MESSAGE = (
+    "I understand you need a smaller amount, but our minimum loan amount is ₹10,000. "
+    "This gives you better terms and lower processing fees. Would you like to consider ₹10,000 instead?"
+)
+
+MAX_AMOUNT_MESSAGE = (
+    "That's a substantial amount! Our maximum personal loan limit is ₹50,00,000. "
+    "Would ₹50,00,000 work for your requirements? We can offer very competitive rates for this amount."
+)
+
+AMOUNT_HELP_MESSAGE = (
+    "I didn't quite understand that! 😊 Let me help you - how much loan amount do you need?\n\n"
+    "You can say:\n"
+    "• '5 lakhs' or '5L'\n"
+    "• '50000' or '50k'\n"
+    "• 'I need 2 lakh rupees'\n\n"
+    "We offer loans from ₹10,000 to ₹50,00,000."
+)
+
+GREETING_AGAIN_MESSAGE = "Hello again! 👋 Let's continue with your loan application. How much loan amount do you need?"
+
+AMOUNT_PROMPT_MESSAGE = (
+    "I'd love to help you with the perfect loan amount! Could you tell me how much you need? "
+    "We offer personal loans from ₹10,000 to ₹50,00,000. What amount would work for you?"
+)
+
+TENURE_PROMPT_MESSAGE = (
+    "What repayment period would be comfortable for you? I can offer:\n\n"
+    "🔹 Short term (6-12 months): Higher EMI, less interest\n"
+    "🔹 Medium term (12-36 months): Balanced EMI\n"
+    "🔹 Long term (36-84 months): Lower EMI, more flexibility\n\n"
+    "Just tell me the number of months that suits you best!"
+)
+
+PURPOSE_MENU = (
+    "Now, what's the purpose of this loan? This helps us offer you the best rates:\n\n"
+    "1️⃣ Personal expenses\n"
+    "2️⃣ Home improvement\n"
+    "3️⃣ Education\n"
+    "4️⃣ Medical expenses\n"
+    "5️⃣ Business needs\n"
+    "6️⃣ Wedding\n"
+    "7️⃣ Travel\n"
+    "8️⃣ Debt consolidation\n\n"
+    "Please choose a number or tell me the purpose:"
+)
+
+PURPOSE_PROMPT_MESSAGE = (
+    "Could you please select one of the loan purposes? This helps us:\n"
+    "✅ Offer you better interest rates\n"
+    "✅ Speed up the approval process\n"
+    "✅ Provide customized terms\n\n"
+    "1️⃣ Personal expenses  2️⃣ Home improvement  3️⃣ Education  4️⃣ Medical\n"
+    "5️⃣ Business  6️⃣ Wedding  7️⃣ Travel  8️⃣ Debt consolidation\n\n"
+    "Just type the number or purpose:"
+)
+
+PURPOSE_OPTIONS = ("Personal", "Home improvement", "Education", "Medical", "Business", "Wedding", "Travel", "Debt consolidation")
+
+PURPOSE_BENEFITS = {
+    LoanPurpose.PERSONAL: "Great choice! Personal loans offer maximum flexibility.",
+    LoanPurpose.HOME_IMPROVEMENT: "Excellent! Home improvement loans often qualify for special rates.",
+    LoanPurpose.EDUCATION: "Education is the best investment! You may get preferential rates.",
+    LoanPurpose.MEDICAL: "Health is wealth! Medical loans get priority processing.",
+    LoanPurpose.BUSINESS: "Business growth loans come with flexible repayment options.",
+    LoanPurpose.WEDDING: "Congratulations! Wedding loans have special festive offers.",
+    LoanPurpose.TRAVEL: "Travel loans help you create memories! Quick approval process.",
+    LoanPurpose.DEBT_CONSOLIDATION: "Smart move! Debt consolidation can save you money."
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _tenure_accepted_message(amount: float, tenure: int) -> str:
+    """Tenure confirmation with a rough EMI estimate, followed by the purpose menu"""
+    estimated_emi = (amount * 1.35) / tenure  # Rough estimate
+    return (
+        f"Perfect! {tenure} months is an excellent choice. Your EMI will be approximately "
+        f"₹{estimated_emi:,.0f} (exact amount will be confirmed after approval).\n\n"
+        + PURPOSE_MENU
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _purpose_accepted_message(amount: float, tenure: int, purpose: LoanPurpose) -> str:
+    """Purpose confirmation with the collected requirements, asking for the mobile number"""
+    return (
+        f"{PURPOSE_BENEFITS[purpose]}\n\n"
+        "Let me summarize your loan requirement:\n\n"
+        f"💰 Amount: ₹{amount:,.0f}\n"
+        f"📅 Tenure: {tenure} months\n"
+        f"🎯 Purpose: {purpose.value.replace('_', ' ').title()}\n\n"
+        "Perfect! Now let me verify your details to get you the best rates. "
+        "Could you please share your registered mobile number?"
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _requirements_summary(amount: float, tenure: int, purpose: LoanPurpose) -> str:
+    """Summary of collected requirements when re-entering a completed sales stage"""
+    return (
+        "Perfect! Let me summarize your loan requirement:\n\n"
+        f"💰 Loan Amount: ₹{amount:,.0f}\n"
+        f"📅 Tenure: {tenure} months\n"
+        f"🎯 Purpose: {purpose.value.replace('_', ' ').title()}\n\n"
+        "Now, let me quickly verify your details to proceed with the application. "
+        "Could you please share your registered mobile number?"
+    )
+
+
+# Indian units an amount is spoken in, largest first: (size, singular, plural)
+AMOUNT_WORD_UNITS = ((10000000, 'crore', 'crores'), (100000, 'lakh', 'lakhs'))
+
+
+@functools.lru_cache(maxsize=1024, typed=True)
+def _amount_in_words(amount: float) -> str:
+    """Convert amount to words (Indian format)"""
+    for size, singular, plural in AMOUNT_WORD_UNITS:
+        if amount >= size:
+            count = amount / size
+            if count == 1:
+                return f"1 {singular}"
+            if count.is_integer():
+                return f"{int(count)} {plural}"
+            return f"{count:.1f} {plural}"
+    return f"₹{amount:,}"
+
+
+def _first_by_priority(pattern: re.Pattern, text: str):
+    """Leftmost match of the earliest alternative that matches at all, in one scan"""
+    best = None
+    for match in pattern.finditer(text):
+        if best is None or match.lastindex < best.lastindex:
+            best = match
+            if best.lastindex == 1:
+                break
+    return best
 
 
 class SalesAgent(BaseAgent):
@@ -14,110 +221,90 @@ class SalesAgent(BaseAgent):
     
     def __init__(self):
         super().__init__("Sales Agent")
-        self.ai_helper = AIHelper()
-        self.loan_purposes = {
-            "1": LoanPurpose.PERSONAL,
-            "2": LoanPurpose.HOME_IMPROVEMENT,
-            "3": LoanPurpose.EDUCATION,
-            "4": LoanPurpose.MEDICAL,
-            "5": LoanPurpose.BUSINESS,
-            "6": LoanPurpose.WEDDING,
-            "7": LoanPurpose.TRAVEL,
-            "8": LoanPurpose.DEBT_CONSOLIDATION
-        }
+        self.ai_helper = ai_helper
     
     async def process(self, message: str, context: ConversationContext) -> ChatResponse:
         """Process sales-related messages and collect loan requirements"""
         
+        # Lowercased once per turn and handed to the extractors
+        lowered = message.lower()
+        
         # Check if user is confirming a typo correction (yes/no response)
-        message_lower = message.lower().strip()
+        message_lower = lowered.strip()
         if not context.loan_request or not context.loan_request.amount:
             # Check if this is a confirmation to a previous amount with typo
-            if message_lower in ['yes', 'yeah', 'yup', 'correct', 'right', 'ok', 'okay', 'confirm']:
-                # Check if there's a pending amount in metadata
-                if hasattr(context, 'metadata') and context.metadata and 'pending_amount' in context.metadata:
-                    amount = context.metadata['pending_amount']
+            if message_lower in TYPO_CONFIRM_WORDS:
+                # Take the pending amount out of metadata, if there is one
+                amount = context.metadata.pop('pending_amount', None)
+                if amount is not None:
                     if not context.loan_request:
                         context.loan_request = LoanRequest(amount=amount)
                     else:
                         context.loan_request.amount = amount
                     
-                    # Clear pending amount
-                    del context.metadata['pending_amount']
-                    
-                    amount_in_words = self._amount_in_words(amount)
+                    amount_in_words = _amount_in_words(amount)
                     return self._generate_response(
                         session_id=context.session_id,
-                        message=f"Great! ✅ {amount_in_words} (₹{amount:,.0f}) confirmed.\n\n"
-                               f"Now, let me ask about the repayment period. "
-                               f"What tenure would work best for you? "
-                               f"We offer flexible options from 6 months to 7 years.\n\n"
-                               f"Longer tenure = Lower monthly EMI\n"
-                               f"Shorter tenure = Less total interest\n\n"
-                               f"What would you prefer?",
+                        message=f"Great! ✅ {amount_in_words} (₹{amount:,.0f}) confirmed.\n\n" + TENURE_QUESTION,
                         stage=ChatStage.SALES
                     )
             
-            return await self._collect_loan_amount(message, context)
+            return await self._collect_loan_amount(message, context, lowered)
         
         # If we don't have tenure yet
         if not context.loan_request.tenure:
-            return await self._collect_tenure(message, context)
+            return await self._collect_tenure(message, context, lowered)
         
         # If we don't have purpose yet
         if not context.loan_request.purpose:
-            return await self._collect_purpose(message, context)
+            return await self._collect_purpose(message, context, lowered)
         
         # All loan details collected, move to verification
         return self._generate_response(
             session_id=context.session_id,
-            message="Perfect! Let me summarize your loan requirement:\n\n"
-                   f"💰 Loan Amount: ₹{context.loan_request.amount:,.0f}\n"
-                   f"📅 Tenure: {context.loan_request.tenure} months\n"
-                   f"🎯 Purpose: {context.loan_request.purpose.value.replace('_', ' ').title()}\n\n"
-                   "Now, let me quickly verify your details to proceed with the application. "
-                   "Could you please share your registered mobile number?",
+            message=_requirements_summary(
+                context.loan_request.amount, context.loan_request.tenure, context.loan_request.purpose
+            ),
             stage=ChatStage.VERIFICATION,
             requires_input=True
         )
     
-    async def _collect_loan_amount(self, message: str, context: ConversationContext) -> ChatResponse:
+    async def _collect_loan_amount(
+        self,
+        message: str,
+        context: ConversationContext,
+        message_lower: str = None
+    ) -> ChatResponse:
         """Collect loan amount from user with AI assistance"""
         
         # First check if message is a plain number (potential loan amount)
         # This prevents valid amounts from being flagged as gibberish
-        amount = self._extract_amount(message)
+        amount = self._extract_amount(message, message_lower)
         if not amount:
             # Try AI extraction as well
             amount = self.ai_helper.extract_loan_amount(message)
         
         # If we found a valid amount, skip intent analysis and process it directly
         if amount:
-            # Check for typos before accepting the amount
-            has_typo, corrected_text = self._detect_typo(message)
-            
             if amount < 10000:
                 return self._generate_response(
                     session_id=context.session_id,
-                    message="I understand you need a smaller amount, but our minimum loan amount is ₹10,000. "
-                           "This gives you better terms and lower processing fees. Would you like to consider ₹10,000 instead?",
+                    message=MIN_AMOUNT_MESSAGE,
                     stage=ChatStage.SALES
                 )
             elif amount > 5000000:
                 return self._generate_response(
                     session_id=context.session_id,
-                    message="That's a substantial amount! Our maximum personal loan limit is ₹50,00,000. "
-                           "Would ₹50,00,000 work for your requirements? We can offer very competitive rates for this amount.",
+                    message=MAX_AMOUNT_MESSAGE,
                     stage=ChatStage.SALES
                 )
             else:
-                # Check if there's a typo and ask for confirmation
+                # Check for typos before accepting the amount, and ask for confirmation
+                has_typo, corrected_text = self._detect_typo(message)
                 if has_typo:
-                    amount_in_words = self._amount_in_words(amount)
+                    amount_in_words = _amount_in_words(amount)
                     
                     # Store pending amount in context metadata for confirmation
-                    if not hasattr(context, 'metadata') or context.metadata is None:
-                        context.metadata = {}
                     context.metadata['pending_amount'] = amount
                     
                     return self._generate_response(
@@ -137,45 +324,31 @@ class SalesAgent(BaseAgent):
                     context.loan_request.amount = amount
                 
                 # Smart response acknowledging understanding
-                amount_in_words = self._amount_in_words(amount)
+                amount_in_words = _amount_in_words(amount)
                 
                 return self._generate_response(
                     session_id=context.session_id,
                     message=f"Perfect! I understand you need {amount_in_words} (₹{amount:,.0f}) 👍\n\n"
-                           f"That's a great amount for your financial needs. "
-                           f"Now, let me ask about the repayment period. "
-                           f"What tenure would work best for you? "
-                           f"We offer flexible options from 6 months to 7 years.\n\n"
-                           f"Longer tenure = Lower monthly EMI\n"
-                           f"Shorter tenure = Less total interest\n\n"
-                           f"What would you prefer?",
+                           f"That's a great amount for your financial needs. " + TENURE_QUESTION,
                     stage=ChatStage.SALES
                 )
         
         # No valid amount found, use AI to understand intent
-        intent_analysis = self.ai_helper.understand_intent(message, 'sales')
+        intent_analysis = await self.ai_helper.analyze_and_respond(message, 'sales')
         
         # Handle random/gibberish messages
         if intent_analysis.get('is_random') or intent_analysis['intent'] == 'random_gibberish':
             return self._generate_response(
                 session_id=context.session_id,
-                message="I didn't quite understand that! 😊 Let me help you - how much loan amount do you need?\n\n"
-                       "You can say:\n"
-                       "• '5 lakhs' or '5L'\n"
-                       "• '50000' or '50k'\n"
-                       "• 'I need 2 lakh rupees'\n\n"
-                       "We offer loans from ₹10,000 to ₹50,00,000.",
+                message=AMOUNT_HELP_MESSAGE,
                 stage=ChatStage.SALES
             )
         
         # Handle questions
         if intent_analysis['intent'] == 'ask_question':
-            ai_response = self.ai_helper.generate_contextual_response(
-                message, intent_analysis, 'sales', {}
-            )
             return self._generate_response(
                 session_id=context.session_id,
-                message=ai_response + "\n\nNow, how much loan amount do you need?",
+                message=intent_analysis['response'] + "\n\nNow, how much loan amount do you need?",
                 stage=ChatStage.SALES
             )
         
@@ -183,22 +356,26 @@ class SalesAgent(BaseAgent):
         if intent_analysis['intent'] == 'greeting':
             return self._generate_response(
                 session_id=context.session_id,
-                message="Hello again! 👋 Let's continue with your loan application. How much loan amount do you need?",
+                message=GREETING_AGAIN_MESSAGE,
                 stage=ChatStage.SALES
             )
         
         # If we reach here, no valid amount was found
         return self._generate_response(
             session_id=context.session_id,
-            message="I'd love to help you with the perfect loan amount! Could you tell me how much you need? "
-                   "We offer personal loans from ₹10,000 to ₹50,00,000. What amount would work for you?",
+            message=AMOUNT_PROMPT_MESSAGE,
             stage=ChatStage.SALES
         )
     
-    async def _collect_tenure(self, message: str, context: ConversationContext) -> ChatResponse:
+    async def _collect_tenure(
+        self,
+        message: str,
+        context: ConversationContext,
+        message_lower: str = None
+    ) -> ChatResponse:
         """Collect loan tenure from user"""
         
-        tenure = self._extract_tenure(message)
+        tenure = self._extract_tenure(message, message_lower)
         
         if tenure:
             if tenure < 6:
@@ -219,105 +396,55 @@ class SalesAgent(BaseAgent):
             else:
                 # Valid tenure, store it
                 context.loan_request.tenure = tenure
-                estimated_emi = (context.loan_request.amount * 1.35) / tenure  # Rough estimate
                 
                 return self._generate_response(
                     session_id=context.session_id,
-                    message=f"Perfect! {tenure} months is an excellent choice. Your EMI will be approximately "
-                           f"₹{estimated_emi:,.0f} (exact amount will be confirmed after approval).\n\n"
-                           "Now, what's the purpose of this loan? This helps us offer you the best rates:\n\n"
-                           "1️⃣ Personal expenses\n"
-                           "2️⃣ Home improvement\n"
-                           "3️⃣ Education\n"
-                           "4️⃣ Medical expenses\n"
-                           "5️⃣ Business needs\n"
-                           "6️⃣ Wedding\n"
-                           "7️⃣ Travel\n"
-                           "8️⃣ Debt consolidation\n\n"
-                           "Please choose a number or tell me the purpose:",
+                    message=_tenure_accepted_message(context.loan_request.amount, tenure),
                     stage=ChatStage.SALES,
-                    options=["Personal", "Home improvement", "Education", "Medical", "Business", "Wedding", "Travel", "Debt consolidation"]
+                    options=list(PURPOSE_OPTIONS)
                 )
         else:
             return self._generate_response(
                 session_id=context.session_id,
-                message="What repayment period would be comfortable for you? I can offer:\n\n"
-                       "🔹 Short term (6-12 months): Higher EMI, less interest\n"
-                       "🔹 Medium term (12-36 months): Balanced EMI\n"
-                       "🔹 Long term (36-84 months): Lower EMI, more flexibility\n\n"
-                       "Just tell me the number of months that suits you best!",
+                message=TENURE_PROMPT_MESSAGE,
                 stage=ChatStage.SALES
             )
     
-    async def _collect_purpose(self, message: str, context: ConversationContext) -> ChatResponse:
+    async def _collect_purpose(
+        self,
+        message: str,
+        context: ConversationContext,
+        message_lower: str = None
+    ) -> ChatResponse:
         """Collect loan purpose from user"""
         
-        purpose = self._extract_purpose(message)
+        purpose = self._extract_purpose(message, message_lower)
         
         if purpose:
             context.loan_request.purpose = purpose
             
-            purpose_benefits = {
-                LoanPurpose.PERSONAL: "Great choice! Personal loans offer maximum flexibility.",
-                LoanPurpose.HOME_IMPROVEMENT: "Excellent! Home improvement loans often qualify for special rates.",
-                LoanPurpose.EDUCATION: "Education is the best investment! You may get preferential rates.",
-                LoanPurpose.MEDICAL: "Health is wealth! Medical loans get priority processing.",
-                LoanPurpose.BUSINESS: "Business growth loans come with flexible repayment options.",
-                LoanPurpose.WEDDING: "Congratulations! Wedding loans have special festive offers.",
-                LoanPurpose.TRAVEL: "Travel loans help you create memories! Quick approval process.",
-                LoanPurpose.DEBT_CONSOLIDATION: "Smart move! Debt consolidation can save you money."
-            }
-            
             return self._generate_response(
                 session_id=context.session_id,
-                message=f"{purpose_benefits[purpose]}\n\n"
-                       "Let me summarize your loan requirement:\n\n"
-                       f"💰 Amount: ₹{context.loan_request.amount:,.0f}\n"
-                       f"📅 Tenure: {context.loan_request.tenure} months\n"
-                       f"🎯 Purpose: {purpose.value.replace('_', ' ').title()}\n\n"
-                       "Perfect! Now let me verify your details to get you the best rates. "
-                       "Could you please share your registered mobile number?",
+                message=_purpose_accepted_message(context.loan_request.amount, context.loan_request.tenure, purpose),
                 stage=ChatStage.VERIFICATION
             )
         else:
             return self._generate_response(
                 session_id=context.session_id,
-                message="Could you please select one of the loan purposes? This helps us:\n"
-                       "✅ Offer you better interest rates\n"
-                       "✅ Speed up the approval process\n"
-                       "✅ Provide customized terms\n\n"
-                       "1️⃣ Personal expenses  2️⃣ Home improvement  3️⃣ Education  4️⃣ Medical\n"
-                       "5️⃣ Business  6️⃣ Wedding  7️⃣ Travel  8️⃣ Debt consolidation\n\n"
-                       "Just type the number or purpose:",
+                message=PURPOSE_PROMPT_MESSAGE,
                 stage=ChatStage.SALES,
-                options=["Personal", "Home improvement", "Education", "Medical", "Business", "Wedding", "Travel", "Debt consolidation"]
+                options=list(PURPOSE_OPTIONS)
             )
     
-    def _extract_amount(self, message: str) -> Optional[float]:
+    def _extract_amount(self, message: str, message_lower: str = None) -> Optional[float]:
         """Extract loan amount from message"""
         # Remove common words and extract numbers
-        message = message.lower().replace(',', '')
+        message = (message_lower if message_lower is not None else message.lower()).replace(',', '')
         
         # Look for patterns like "5 lakh", "2.5 lakh", "50000", "50k"
-        patterns = [
-            r'(\d+\.?\d*)\s*lakh',
-            r'(\d+\.?\d*)\s*crore',
-            r'(\d+\.?\d*)\s*k\b',
-            r'₹\s*(\d+\.?\d*)',
-            r'(\d{4,})'  # Any number with 4+ digits
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, message)
-            if match:
-                amount = float(match.group(1))
-                if 'lakh' in message:
-                    amount *= 100000
-                elif 'crore' in message:
-                    amount *= 10000000
-                elif 'k' in message and amount < 1000:
-                    amount *= 1000
-                return amount
+        match = _first_by_priority(AMOUNT_RE, message)
+        if match:
+            return float(match.group(match.lastindex)) * AMOUNT_UNIT_MULTIPLIERS.get(match.lastgroup, 1)
         
         return None
     
@@ -326,103 +453,28 @@ class SalesAgent(BaseAgent):
         Detect common typos in loan amount messages
         Returns (has_typo: bool, corrected_message: str)
         """
-        typo_map = {
-            'laksh': 'lakh',
-            'laskh': 'lakh',
-            'laks': 'lakh',
-            'lakhs': 'lakhs',
-            'lacs': 'lakh',
-            'lacs': 'lakh',
-            'crore': 'crore',
-            'cror': 'crore',
-            'crores': 'crores',
-            'crors': 'crores'
-        }
-        
-        message_lower = message.lower()
-        corrected = message
-        has_typo = False
-        
-        for typo, correct in typo_map.items():
-            # Skip if it's already correct
-            if typo == correct or typo == correct + 's':
-                continue
-                
-            # Check for the typo in the message
-            pattern = r'\b' + re.escape(typo) + r'\b'
-            if re.search(pattern, message_lower, re.IGNORECASE):
-                has_typo = True
-                # Preserve case in correction
-                corrected = re.sub(pattern, correct, corrected, flags=re.IGNORECASE)
+        corrected, typo_count = AMOUNT_TYPO_RE.subn(
+            lambda match: AMOUNT_TYPOS[match.group(0).lower()], message
+        )
+        has_typo = typo_count > 0
         
         return has_typo, corrected
     
-    def _amount_in_words(self, amount: int) -> str:
-        """Convert amount to words (Indian format)"""
-        if amount >= 10000000:  # 1 crore or more
-            crores = amount / 10000000
-            if crores == int(crores):
-                return f"{int(crores)} crore" if crores == 1 else f"{int(crores)} crores"
-            return f"{crores:.1f} crores"
-        elif amount >= 100000:  # 1 lakh or more
-            lakhs = amount / 100000
-            if lakhs == int(lakhs):
-                return f"{int(lakhs)} lakh" if lakhs == 1 else f"{int(lakhs)} lakhs"
-            return f"{lakhs:.1f} lakhs"
-        elif amount >= 1000:  # thousands
-            return f"₹{amount:,}"
-        else:
-            return f"₹{amount}"
-    
-    def _extract_tenure(self, message: str) -> Optional[int]:
+    def _extract_tenure(self, message: str, message_lower: str = None) -> Optional[int]:
         """Extract tenure from message"""
         # Look for numbers followed by months/years
-        patterns = [
-            r'(\d+)\s*month',
-            r'(\d+)\s*year',
-            r'(\d+)\s*yr',
-            r'(\d+)\s*mon',
-            r'(\d+)(?:\s+months?)?(?:\s+years?)?'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, message.lower())
-            if match:
-                tenure = int(match.group(1))
-                if 'year' in message or 'yr' in message:
-                    tenure *= 12
-                return tenure
+        match = _first_by_priority(TENURE_RE, message_lower if message_lower is not None else message.lower())
+        if match:
+            return int(match.group(match.lastindex)) * TENURE_UNIT_MONTHS.get(match.lastgroup, 1)
         
         return None
     
-    def _extract_purpose(self, message: str) -> Optional[LoanPurpose]:
+    def _extract_purpose(self, message: str, message_lower: str = None) -> Optional[LoanPurpose]:
         """Extract loan purpose from message"""
-        message_lower = message.lower()
-        message_stripped = message.strip()
-        
-        # Check for number selection (exact match or within message)
-        for num, purpose in self.loan_purposes.items():
-            # Check if the message is just the number
-            if message_stripped == num:
-                return purpose
-            # Check if number appears in message with word boundaries
-            if re.search(r'\b' + num + r'\b', message):
-                return purpose
-        
-        # Check for keyword matching
-        purpose_keywords = {
-            LoanPurpose.PERSONAL: ['personal', 'general', 'miscellaneous'],
-            LoanPurpose.HOME_IMPROVEMENT: ['home', 'house', 'renovation', 'repair', 'improvement'],
-            LoanPurpose.EDUCATION: ['education', 'study', 'course', 'college', 'school'],
-            LoanPurpose.MEDICAL: ['medical', 'health', 'hospital', 'treatment', 'medicine'],
-            LoanPurpose.BUSINESS: ['business', 'startup', 'investment', 'work', 'office'],
-            LoanPurpose.WEDDING: ['wedding', 'marriage', 'shaadi', 'ceremony'],
-            LoanPurpose.TRAVEL: ['travel', 'vacation', 'trip', 'tour', 'holiday'],
-            LoanPurpose.DEBT_CONSOLIDATION: ['debt', 'consolidation', 'loan closure', 'payoff']
-        }
-        
-        for purpose, keywords in purpose_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                return purpose
+        # Check for number selection (exact match or within message); lower menu numbers win
+        numbers = PURPOSE_NUMBER_RE.findall(message)
+        if numbers:
+            return PURPOSE_NUMBERS[min(numbers)]
         
-        return None
\ No newline at end of file
+        # Check for keyword matching, keeping PURPOSE_KEYWORDS order when several match
+        return match_purpose(message_lower if message_lower is not None else message.lower())
\ No newline at end of file
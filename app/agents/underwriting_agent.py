@@ -35,6 +35,11 @@ class UnderwritingAgent(BaseAgent):
                 stage=ChatStage.VERIFICATION
             )
 
+        return await self.process_verified(context)
+
+    async def process_verified(self, context: ConversationContext) -> ChatResponse:
+        """Underwrite a customer the verification agent has just verified"""
+
         # Fetch credit score
         credit_result = await self.dummy_services.get_credit_score(context.customer_phone)
         context.credit_score = credit_result.credit_score
@@ -7,7 +7,7 @@ from typing import Optional
 from app.agents.base_agent import BaseAgent
 from app.models.schemas import ConversationContext, ChatResponse, ChatStage
 from app.services.dummy_services import DummyServices
-from app.utils.ai_helper import AIHelper
+from app.utils.ai_helper import ai_helper
 
 
 class VerificationAgent(BaseAgent):
@@ -16,7 +16,7 @@ class VerificationAgent(BaseAgent):
     def __init__(self):
         super().__init__("Verification Agent")
         self.dummy_services = DummyServices()
-        self.ai_helper = AIHelper()
+        self.ai_helper = ai_helper
     
     async def process(self, message: str, context: ConversationContext) -> ChatResponse:
         """Process verification messages and validate customer"""
@@ -43,7 +43,8 @@ class VerificationAgent(BaseAgent):
                            "This will help me get you the best possible interest rate and terms.\n\n"
                            "Please wait a moment while I fetch your personalized offer... 🔄",
                     stage=ChatStage.UNDERWRITING,
-                    requires_input=False
+                    requires_input=False,
+                    metadata={"auto_transition": ChatStage.UNDERWRITING.value}
                 )
             else:
                 return self._generate_response(
@@ -64,8 +64,7 @@ async def chat_with_routing(chat_message: ChatMessage, request: Request, routing
         )
         
         # Add routing information to response
-        if hasattr(response, 'metadata'):
-            response.metadata["explicit_routing_strategy"] = routing_strategy
+        response.metadata["explicit_routing_strategy"] = routing_strategy
         
         return response
         
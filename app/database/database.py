@@ -3,7 +3,7 @@ Database setup and configuration for the loan assistant
 Uses SQLite for simplicity with dummy customer data
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, LargeBinary, Index
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime, timezone
 import os
@@ -18,7 +18,20 @@ DATABASE_URL = "sqlite:///./loan_assistant.db"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 
 # Create session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Async engine and pooled sessions for the chat hot path
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./loan_assistant.db"
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+    AsyncSessionMaker = async_sessionmaker(async_engine, expire_on_commit=False)
+except ImportError:
+    # aiosqlite not installed, callers fall back to SessionLocal
+    async_engine = None
+    AsyncSessionMaker = None
 
 # Base class
 Base = declarative_base()
@@ -64,12 +77,29 @@ class ChatSession(Base):
     session_id = Column(String, unique=True, index=True)
     customer_phone = Column(String, nullable=True)
     current_stage = Column(String, default="greeting")  # greeting, sales, verification, underwriting, decision
-    context = Column(String)  # JSON string of conversation context
+    context = Column(LargeBinary)  # serialization.pack() snapshot of conversation context
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
 
+class ConversationHistoryEntry(Base):
+    """Append-only conversation history, one row per message"""
+    __tablename__ = "conversation_history"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, index=True)
+    turn_index = Column(Integer)  # position of the message within the session
+    sender = Column(String)  # user, assistant
+    message = Column(String)
+    entry_metadata = Column(String, nullable=True)  # JSON string of per-message metadata
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_conversation_history_session_turn", "session_id", "turn_index"),
+    )
+
+
 def get_db():
     """Dependency to get database session"""
     db = SessionLocal()
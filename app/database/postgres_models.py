@@ -12,6 +12,7 @@ from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from datetime import datetime, timezone, timedelta
 import uuid
 import os
+import random
 import enum
 import logging
 
@@ -543,11 +544,9 @@ def get_db_session_with_retry():
 
 def generate_user_id():
     """Generate unique user ID like QL123456"""
-    import random
     return f"QL{random.randint(100000, 999999)}"
 
 
 def generate_loan_id():
     """Generate unique loan ID like QL-LN-123456"""
-    import random
     return f"QL-LN-{random.randint(100000, 999999)}"
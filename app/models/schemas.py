@@ -2,7 +2,7 @@
 Pydantic models for request/response schemas
 """
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, Field, PrivateAttr, validator
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
@@ -58,7 +58,11 @@ class ChatResponse(BaseModel):
     options: Optional[list] = None
     file_upload: bool = False
     final: bool = False
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    
+    @validator('metadata', pre=True)
+    def default_metadata(cls, v):
+        return {} if v is None else v
 
 
 class LoanRequest(BaseModel):
@@ -147,4 +151,11 @@ class ConversationContext(BaseModel):
     salary_slip_uploaded: Optional[bool] = None
     conversation_history: list = []
     current_stage: ChatStage = ChatStage.GREETING
-    metadata: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    
+    # Index of the next persisted history message; runtime state, not part of the snapshot
+    _history_turns: int = PrivateAttr(default=0)
+    
+    @validator('metadata', pre=True)
+    def default_metadata(cls, v):
+        return {} if v is None else v
\ No newline at end of file
@@ -7,6 +7,7 @@ from typing import Dict, Any, List, Optional, Callable
 from enum import Enum
 import json
 import asyncio
+import itertools
 from datetime import datetime
 import uuid
 
@@ -238,7 +239,8 @@ class AgentOrchestrator:
         
         # Analyze conversation sentiment and intent
         if context.conversation_history:
-            last_messages = context.conversation_history[-5:]  # Last 5 messages
+            history = context.conversation_history
+            last_messages = itertools.islice(history, max(len(history) - 5, 0), None)  # Last 5 messages (list or deque)
             
             # Simple intent detection
             user_messages = [msg["message"] for msg in last_messages if msg["sender"] == "user"]
@@ -307,7 +309,7 @@ class AgentOrchestrator:
         )
         
         # Check if we have metadata for intelligent routing
-        if hasattr(context, 'metadata') and context.metadata:
+        if context.metadata:
             intent_scores = context.metadata.get("intent_scores", {})
             flow_analysis = context.metadata.get("flow_analysis", {})
             
@@ -569,14 +571,13 @@ class AgentOrchestrator:
         """Post-process response with additional intelligence"""
         
         # Add conversation metadata
-        if hasattr(context, 'metadata'):
-            response.metadata = {
-                "orchestration_info": {
-                    "agents_used": context.metadata.get("agent_history", []),
-                    "confidence_scores": context.metadata.get("confidence_scores", {}),
-                    "processing_time": datetime.now().isoformat()
-                }
+        response.metadata = {
+            "orchestration_info": {
+                "agents_used": context.metadata.get("agent_history", []),
+                "confidence_scores": context.metadata.get("confidence_scores", {}),
+                "processing_time": datetime.now().isoformat()
             }
+        }
         
         return response
     
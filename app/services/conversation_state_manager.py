@@ -8,6 +8,7 @@ from enum import Enum
 from datetime import datetime, timedelta, timezone
 import json
 import asyncio
+import itertools
 from dataclasses import dataclass, asdict
 import uuid
 import logging
@@ -387,7 +388,7 @@ class ConversationStateManager:
         
         # Add conversation history summary
         serializable_context['conversation_length'] = len(context.conversation_history)
-        serializable_context['metadata'] = context.metadata.copy() if hasattr(context, 'metadata') else {}
+        serializable_context['metadata'] = context.metadata.copy()
         
         return serializable_context
     
@@ -430,7 +431,8 @@ class ConversationStateManager:
         
         # Check user frustration
         if context.conversation_history:
-            recent_messages = context.conversation_history[-3:]  # Last 3 messages
+            history = context.conversation_history
+            recent_messages = itertools.islice(history, max(len(history) - 3, 0), None)  # Last 3 messages (list or deque)
             user_messages = [msg["message"].lower() for msg in recent_messages if msg["sender"] == "user"]
             
             for message in user_messages:
@@ -585,15 +585,14 @@ class IntelligentAgentRouter:
             await self._update_agent_performance(agent_name, True, execution_time, response)
             
             # Add routing metadata to response
-            if hasattr(response, 'metadata'):
-                response.metadata.update({
-                    "routing_decision": {
-                        "selected_agent": agent_name,
-                        "confidence_score": decision.confidence_score,
-                        "rationale": decision.rationale,
-                        "strategy": decision.routing_strategy.value
-                    }
-                })
+            response.metadata.update({
+                "routing_decision": {
+                    "selected_agent": agent_name,
+                    "confidence_score": decision.confidence_score,
+                    "rationale": decision.rationale,
+                    "strategy": decision.routing_strategy.value
+                }
+            })
             
             self.routing_analytics["successful_routings"] += 1
             
@@ -4,6 +4,8 @@ Uses ReportLab for professional PDF generation
 """
 
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, Any
 from reportlab.lib import colors
@@ -15,6 +17,9 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 
 from app.models.schemas import UnderwritingResult
 
+# ReportLab builds are CPU-bound and blocking, so they run on a small bounded pool
+PDF_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pdf")
+
 
 class PDFService:
     """Service for generating PDF documents"""
@@ -39,7 +44,20 @@ class PDFService:
         loan_details: UnderwritingResult,
         session_id: str
     ) -> str:
-        """Generate loan sanction letter PDF"""
+        """Generate loan sanction letter PDF without blocking the event loop"""
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            PDF_EXECUTOR, self._build_sanction_letter, customer_data, loan_details, session_id
+        )
+    
+    def _build_sanction_letter(
+        self,
+        customer_data: Dict[str, Any],
+        loan_details: UnderwritingResult,
+        session_id: str
+    ) -> str:
+        """Build the sanction letter PDF (blocking)"""
         
         # Generate unique filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -4,15 +4,115 @@ AI Helper - Intelligent message understanding and response generation using Open
 
 import os
 import re
-import json
+import copy
+import asyncio
 from typing import Dict, Any, Optional, Tuple
 import logging
 
+from app.utils import serialization
+from app.utils.semantic_cache import SemanticCache
+
 logger = logging.getLogger(__name__)
 
 # Set your OpenAI API key as environment variable or replace with your key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
+# A message must contain a digit or a spelt-out amount word for there to be an amount to extract
+AMOUNT_HINT_RE = re.compile(r'\d|hundred|thousand|lakh|lac|crore|cror', re.IGNORECASE)
+
+# Messages that may carry an amount, tenure or phone number; paraphrases of them ("5 lakh" /
+# "6 lakh") carry different data, so their intents are only served on an exact match
+DATA_HINT_RE = re.compile(AMOUNT_HINT_RE.pattern + r'|year|month|yr', re.IGNORECASE)
+
+# Model-backed intents and answers, shared by every AIHelper since they don't depend on the session
+semantic_cache = SemanticCache()
+
+# Rule-based intent keywords
+GREETING_WORDS = ('hi', 'hello', 'hey', 'good morning', 'good evening', 'namaste')
+QUESTION_WORDS = ('what', 'how', 'when', 'where', 'why', 'which', 'can', 'should')
+CONFIRMATION_WORDS = frozenset({'yes', 'yeah', 'yep', 'ok', 'okay', 'sure', 'no', 'nope', 'nah'})
+
+# Intent requests arriving within this window are classified by one model call
+INTENT_BATCH_WAIT_MS = 15
+INTENT_BATCH_SIZE = 16
+
+INTENT_LABELS = """- provide_loan_amount
+- provide_tenure
+- provide_phone
+- provide_purpose
+- ask_question
+- greeting
+- random_gibberish
+- off_topic
+- confirmation (yes/no)"""
+
+# What the assistant may tell customers when answering their questions
+LOAN_FACTS = """- Loan amounts: ₹10,000 to ₹50,00,000
+- Interest rates: 8.3% to 17% based on purpose
+- Tenure: 6 to 60 months
+- Minimal documentation needed
+- Quick approval in minutes"""
+
+# Classification prompts also answer questions, so a question costs one model call, not two
+INTENT_ANSWER_INSTRUCTIONS = f"""If the intent is ask_question, also answer it in "answer" as a helpful loan assistant for QuickLoan India, using only these facts:
+{LOAN_FACTS}
+Keep answers brief (2-3 sentences) and guide them to continue the application. Otherwise "answer" is ""."""
+
+
+class _IntentBatcher:
+    """Coalesces intent classifications from concurrent sessions into one model request"""
+    
+    def __init__(self, helper: "AIHelper", max_wait_ms: int = INTENT_BATCH_WAIT_MS, max_batch: int = INTENT_BATCH_SIZE):
+        self.helper = helper
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        # Referenced here so in-flight batches aren't collected
+        self._tasks = set()
+    
+    async def classify(self, message: str, current_stage: str) -> Dict[str, Any]:
+        """Model classification of one message, or {} if the model call failed"""
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, current_stage, future))
+        
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+    
+    def _flush(self):
+        """Send everything queued so far as one batch"""
+        
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: list):
+        """Classify a batch off the event loop and hand each caller its result"""
+        
+        try:
+            results = await asyncio.to_thread(
+                self.helper._model_intents, [(message, stage) for message, stage, _ in batch]
+            )
+        except Exception as e:
+            logger.debug(f"Batched AI intent understanding failed: {e}")
+            results = [{} for _ in batch]
+        
+        for (_, _, future), parsed in zip(batch, results):
+            if not future.done():
+                future.set_result(parsed)
+
+
 class AIHelper:
     """AI-powered helper for intelligent conversation handling"""
     
@@ -33,6 +133,8 @@ class AIHelper:
                 self.use_ai = False
         else:
             logger.info("OpenAI API key not set. Using rule-based responses.")
+        
+        self._intent_batcher = _IntentBatcher(self)
     
     def extract_loan_amount(self, message: str) -> Optional[int]:
         """
@@ -40,6 +142,10 @@ class AIHelper:
         Examples: "I need 5 lakhs", "50000 rupees", "5L loan"
         """
         
+        # Greetings, questions and gibberish can't hold an amount; don't spend a model call on them
+        if not AMOUNT_HINT_RE.search(message):
+            return None
+        
         # Try AI extraction first if available
         if self.use_ai:
             try:
@@ -169,68 +275,182 @@ If no amount found, return 'NONE'."""},
         }
         """
         
-        result = {
+        result = self._intent_without_model(message, current_stage)
+        if result is not None:
+            return result
+        
+        result = self._new_intent()
+        result.update(self._model_intent(message, current_stage))
+        result = self._apply_intent_rules(message, result)
+        self._remember_intent(message, current_stage, result)
+        return result
+    
+    async def understand_intent_async(self, message: str, current_stage: str) -> Dict[str, Any]:
+        """Like understand_intent, but the model call is shared with concurrent sessions and
+        nothing blocks the event loop"""
+        
+        result = await self._off_loop(self._intent_without_model, message, current_stage)
+        if result is not None:
+            return result
+        
+        result = self._new_intent()
+        result.update(await self._intent_batcher.classify(message, current_stage))
+        # The rules may still call the model for amount and tenure extraction
+        result = await asyncio.to_thread(self._apply_intent_rules, message, result)
+        await self._off_loop(self._remember_intent, message, current_stage, result)
+        return result
+    
+    async def _off_loop(self, func, *args):
+        """Run cache work in a worker thread whenever it may embed (model load or encode);
+        exact-match-only cache work is a dict lookup and stays on the loop"""
+        
+        if self.use_ai and semantic_cache.enabled:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+    
+    async def analyze_and_respond(self, message: str, current_stage: str) -> Dict[str, Any]:
+        """
+        understand_intent_async, plus the reply to show under 'response' when the message is a question.
+        The model answers questions while classifying them; a separate answer call is only made
+        when it didn't (rule-based override, cache entry without an answer, or no model at all).
+        """
+        
+        analysis = await self.understand_intent_async(message, current_stage)
+        if analysis['intent'] != 'ask_question':
+            return analysis
+        
+        answer = analysis.get('answer')
+        if answer:
+            await self._off_loop(semantic_cache.put, f"answer:{current_stage}", message, answer)
+        elif self.use_ai:
+            answer = await asyncio.to_thread(
+                self.generate_contextual_response, message, analysis, current_stage, {}
+            )
+        else:
+            answer = self.generate_contextual_response(message, analysis, current_stage, {})
+        analysis['response'] = answer
+        return analysis
+    
+    def _intent_without_model(self, message: str, current_stage: str) -> Optional[Dict[str, Any]]:
+        """Intent for gibberish, rule-only setups and cached messages; None if the model is needed"""
+        
+        # Check if message is gibberish/random
+        if self._is_gibberish(message):
+            return {
+                'intent': 'random_gibberish',
+                'confidence': 0.9,
+                'extracted_data': {},
+                'is_random': True
+            }
+        
+        if not self.use_ai:
+            return self._apply_intent_rules(message, self._new_intent())
+        
+        # Callers get their own copy of a cached result
+        cached = semantic_cache.get(f"intent:{current_stage}", message, not DATA_HINT_RE.search(message))
+        if cached is not None:
+            return copy.deepcopy(cached)
+        return None
+    
+    @staticmethod
+    def _remember_intent(message: str, current_stage: str, result: Dict[str, Any]):
+        """Cache a model-backed intent; only exact repeats may reuse one that carries data"""
+        
+        semantic_cache.put(
+            f"intent:{current_stage}", message, copy.deepcopy(result), not DATA_HINT_RE.search(message)
+        )
+    
+    @staticmethod
+    def _new_intent() -> Dict[str, Any]:
+        """Intent before any classification"""
+        return {
             'intent': 'unknown',
             'confidence': 0.5,
             'extracted_data': {},
             'is_random': False
         }
-        
-        # Check if message is gibberish/random
-        if self._is_gibberish(message):
-            result['intent'] = 'random_gibberish'
-            result['is_random'] = True
-            result['confidence'] = 0.9
-            return result
-        
-        if self.use_ai:
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": f"""You are analyzing a user message in a loan application chatbot. Current stage: {current_stage}.
+    
+    def _model_intent(self, message: str, current_stage: str) -> Dict[str, Any]:
+        """Model classification of one message, or {} if the call failed"""
+        
+        try:
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": f"""You are analyzing a user message in a loan application chatbot. Current stage: {current_stage}.
 Classify the intent as one of:
-- provide_loan_amount
-- provide_tenure
-- provide_phone
-- provide_purpose
-- ask_question
-- greeting
-- random_gibberish
-- off_topic
-- confirmation (yes/no)
+{INTENT_LABELS}
 
-Return ONLY a JSON with: {{"intent": "...", "confidence": 0.0-1.0, "reasoning": "..."}}"""},
-                        {"role": "user", "content": message}
-                    ],
-                    temperature=0.3,
-                    max_tokens=100
-                )
-                
-                ai_result = response.choices[0].message.content.strip()
-                parsed = json.loads(ai_result)
-                result.update(parsed)
-                
-            except Exception as e:
-                logger.debug(f"AI intent understanding failed: {e}")
+{INTENT_ANSWER_INSTRUCTIONS}
+
+Return ONLY a JSON with: {{"intent": "...", "confidence": 0.0-1.0, "reasoning": "...", "answer": "..."}}"""},
+                    {"role": "user", "content": message}
+                ],
+                temperature=0.3,
+                max_tokens=250
+            )
+            
+            ai_result = response.choices[0].message.content.strip()
+            parsed = serialization.loads(ai_result)
+            return parsed if isinstance(parsed, dict) else {}
+            
+        except Exception as e:
+            logger.debug(f"AI intent understanding failed: {e}")
+            return {}
+    
+    def _model_intents(self, items: list) -> list:
+        """Model classification of several (message, stage) pairs with one request, in order"""
+        
+        if len(items) == 1:
+            return [self._model_intent(*items[0])]
+        
+        numbered = "\n".join(
+            f"{i}. [stage: {stage}] {serialization.dumps(message)}" for i, (message, stage) in enumerate(items, 1)
+        )
+        try:
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": f"""You are analyzing user messages in a loan application chatbot. Each numbered line is a separate conversation, with its current stage.
+Classify the intent of every message as one of:
+{INTENT_LABELS}
+
+{INTENT_ANSWER_INSTRUCTIONS}
+
+Return ONLY a JSON array with one object per message, in the same order: [{{"intent": "...", "confidence": 0.0-1.0, "reasoning": "...", "answer": "..."}}, ...]"""},
+                    {"role": "user", "content": numbered}
+                ],
+                temperature=0.3,
+                max_tokens=250 * len(items)
+            )
+            
+            parsed = serialization.loads(response.choices[0].message.content.strip())
+            if isinstance(parsed, list) and len(parsed) == len(items) and all(isinstance(p, dict) for p in parsed):
+                return parsed
+            logger.debug("Batched AI intent response didn't match the batch, classifying one by one")
+        except Exception as e:
+            logger.debug(f"Batched AI intent understanding failed, classifying one by one: {e}")
+        
+        return [self._model_intent(message, stage) for message, stage in items]
+    
+    def _apply_intent_rules(self, message: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Rule-based intent detection and data extraction, applied over any model classification"""
         
         # Fallback rule-based intent detection
         message_lower = message.lower()
         
         # Greeting detection
-        greetings = ['hi', 'hello', 'hey', 'good morning', 'good evening', 'namaste']
-        if any(g in message_lower for g in greetings) and len(message.split()) <= 3:
+        if any(g in message_lower for g in GREETING_WORDS) and len(message.split()) <= 3:
             result['intent'] = 'greeting'
             result['confidence'] = 0.9
         
         # Question detection
-        question_words = ['what', 'how', 'when', 'where', 'why', 'which', 'can', 'should']
-        if any(q in message_lower for q in question_words) or '?' in message:
+        if any(q in message_lower for q in QUESTION_WORDS) or '?' in message:
             result['intent'] = 'ask_question'
             result['confidence'] = 0.8
         
         # Confirmation detection
-        if message_lower in ['yes', 'yeah', 'yep', 'ok', 'okay', 'sure', 'no', 'nope', 'nah']:
+        if message_lower in CONFIRMATION_WORDS:
             result['intent'] = 'confirmation'
             result['confidence'] = 0.95
         
@@ -330,16 +550,17 @@ Return ONLY a JSON with: {{"intent": "...", "confidence": 0.0-1.0, "reasoning":
         """Handle user questions with AI or fallback responses"""
         
         if self.use_ai:
+            namespace = f"answer:{current_stage}"
+            cached = semantic_cache.get(namespace, message)
+            if cached is not None:
+                return cached
+            
             try:
                 response = self.client.chat.completions.create(
                     model="gpt-4o-mini",
                     messages=[
-                        {"role": "system", "content": """You are a helpful loan assistant for QuickLoan India. Answer questions about:
-- Loan amounts: ₹10,000 to ₹50,00,000
-- Interest rates: 8.3% to 17% based on purpose
-- Tenure: 6 to 60 months
-- Minimal documentation needed
-- Quick approval in minutes
+                        {"role": "system", "content": f"""You are a helpful loan assistant for QuickLoan India. Answer questions about:
+{LOAN_FACTS}
 Keep responses brief (2-3 sentences) and guide them to continue the application."""},
                         {"role": "user", "content": message}
                     ],
@@ -347,7 +568,9 @@ Keep responses brief (2-3 sentences) and guide them to continue the application.
                     max_tokens=150
                 )
                 
-                return response.choices[0].message.content.strip()
+                answer = response.choices[0].message.content.strip()
+                semantic_cache.put(namespace, message, answer)
+                return answer
             except Exception as e:
                 logger.debug(f"AI question answering failed: {e}")
         
@@ -376,3 +599,7 @@ Keep responses brief (2-3 sentences) and guide them to continue the application.
         }
         
         return prompts.get(stage, "How can I help you with your loan?")
+
+
+# Global AI helper instance, shared by the agents
+ai_helper = AIHelper()
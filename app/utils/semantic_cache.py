@@ -0,0 +1,155 @@
+"""
+Semantic cache for AI helper results
+Messages seen before ("hi", "yes") are answered from an exact-match LRU; paraphrases
+("hi there" / "hello there") are matched by sentence embedding, so repeated model calls for
+near-identical messages can be answered from memory.
+The embedding tier uses sentence-transformers + numpy when installed; otherwise only exact
+matches hit.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    # sentence-transformers not installed, semantic lookups are disabled
+    np = None
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_THRESHOLD = 0.92  # cosine similarity a cached message must reach to count as a hit
+DEFAULT_MAX_ENTRIES = 4096  # per namespace; the oldest entry is overwritten once full
+DEFAULT_EXACT_ENTRIES = 8192  # exact matches across all namespaces, least recently used evicted
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse whitespace, so trivially different messages share an entry"""
+    return ' '.join(text.lower().split())
+
+
+class _Namespace:
+    """Fixed-size ring of unit-length embeddings and the values cached for them"""
+
+    def __init__(self, dim: int, max_entries: int):
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.values = [None] * max_entries
+        self.size = 0
+        self.next_slot = 0
+
+    def search(self, vector) -> tuple:
+        """Index and similarity of the closest cached embedding"""
+        scores = self.vectors[:self.size] @ vector
+        best = int(scores.argmax())
+        return best, float(scores[best])
+
+    def add(self, vector, value: Any):
+        slot = self.next_slot
+        self.vectors[slot] = vector
+        self.values[slot] = value
+        self.next_slot = (slot + 1) % len(self.values)
+        self.size = max(self.size, slot + 1)
+
+
+class SemanticCache:
+    """Embedding-similarity cache, partitioned into namespaces (e.g. per stage)"""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        model_name: str = DEFAULT_MODEL_NAME,
+        exact_entries: int = DEFAULT_EXACT_ENTRIES
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.model_name = model_name
+        self.exact_entries = exact_entries
+        self.enabled = SentenceTransformer is not None
+        self._model = None
+        self._namespaces = {}
+        # (namespace, normalized message) -> value, least recently used first
+        self._exact = OrderedDict()
+        self._lock = threading.Lock()
+        # Held only while loading the model, so lookups aren't stalled behind it
+        self._model_lock = threading.Lock()
+        # A miss is usually followed by put() for the same message; keep its embedding per thread
+        self._last = threading.local()
+
+    def _embed(self, text: str):
+        """Unit-length embedding of a normalized message; the model is loaded on first use"""
+        if getattr(self._last, "text", None) == text:
+            return self._last.vector
+
+        model = self._model if self._model is not None else self.load_model()
+        if model is None:
+            return None
+        vector = model.encode(text, normalize_embeddings=True).astype(np.float32)
+        self._last.text, self._last.vector = text, vector
+        return vector
+
+    def load_model(self):
+        """Load the embedding model once, however many threads ask for it; None if unavailable"""
+        if not self.enabled:
+            return None
+
+        with self._model_lock:
+            if self._model is None:
+                try:
+                    self._model = SentenceTransformer(self.model_name)
+                except Exception as e:
+                    logger.warning(f"Semantic cache disabled, embedding model failed to load: {e}")
+                    self.enabled = False
+            return self._model
+
+    def get(self, namespace: str, text: str, semantic: bool = True) -> Optional[Any]:
+        """Value cached for this message, else for the most similar one in the namespace, or None.
+
+        With semantic=False only an exact (normalized) match counts.
+        """
+        key = (namespace, normalize(text))
+        with self._lock:
+            value = self._exact.get(key)
+            if value is not None:
+                self._exact.move_to_end(key)
+                return value
+
+        if not (semantic and self.enabled):
+            return None
+
+        vector = self._embed(key[1])
+        if vector is None:
+            return None
+
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries is None or entries.size == 0:
+                return None
+            best, score = entries.search(vector)
+            return entries.values[best] if score >= self.threshold else None
+
+    def put(self, namespace: str, text: str, value: Any, semantic: bool = True):
+        """Cache a value for a message; with semantic=False it is only found by exact match"""
+        key = (namespace, normalize(text))
+        with self._lock:
+            self._exact[key] = value
+            self._exact.move_to_end(key)
+            if len(self._exact) > self.exact_entries:
+                self._exact.popitem(last=False)
+
+        if not (semantic and self.enabled):
+            return
+
+        vector = self._embed(key[1])
+        if vector is None:
+            return
+
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries is None:
+                entries = self._namespaces[namespace] = _Namespace(vector.shape[0], self.max_entries)
+            entries.add(vector, value)
@@ -0,0 +1,78 @@
+"""
+Serialization helpers for persisted conversation state
+JSON uses orjson when available, falling back to the standard library;
+binary snapshots use msgpack + zstandard when both are installed
+"""
+import json
+import threading
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    # orjson not installed, use stdlib json
+    orjson = None
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:
+    # msgpack/zstandard not installed, binary snapshots fall back to UTF-8 JSON
+    msgpack = None
+    zstandard = None
+
+# Every zstd frame starts with this magic number; JSON never does
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# zstd (de)compressors are not thread-safe, so each thread builds its own once
+_codecs = threading.local()
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to a JSON string; datetimes and enums are encoded natively, anything else via str()"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=str)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Like dumps(), but UTF-8 bytes; orjson output is returned as is, without a decode/encode round-trip"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str).encode()
+
+
+def loads(data) -> Any:
+    """Parse a JSON string or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _zstd_codec():
+    """This thread's (compressor, decompressor) pair"""
+    codec = getattr(_codecs, "zstd", None)
+    if codec is None:
+        codec = (zstandard.ZstdCompressor(level=3), zstandard.ZstdDecompressor())
+        _codecs.zstd = codec
+    return codec
+
+
+def pack(obj: Any) -> bytes:
+    """Serialize to compact bytes: zstd-compressed msgpack, or UTF-8 JSON without those packages"""
+    if msgpack is not None:
+        compressor, _ = _zstd_codec()
+        return compressor.compress(msgpack.packb(obj, default=str))
+    return dumps_bytes(obj)
+
+
+def unpack(data) -> Any:
+    """Parse the output of pack(), or a JSON string / bytes written before snapshots were packed"""
+    if isinstance(data, str):
+        return loads(data)
+    if data[:4] == ZSTD_MAGIC:
+        if msgpack is None:
+            raise RuntimeError("msgpack and zstandard are required to read packed snapshots")
+        _, decompressor = _zstd_codec()
+        return msgpack.unpackb(decompressor.decompress(data), raw=False)
+    return loads(data)
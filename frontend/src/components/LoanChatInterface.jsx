@@ -224,6 +224,19 @@ const LoanChatInterface = () => {
     try {
       const response = await fetch(`http://localhost:8000/api/download-sanction-letter/${sessionId}`)
 
+      // The letter failed to render; show the apology and loan reference in the chat
+      if (response.status === 503) {
+        const data = await response.json()
+        setMessages(prev => [...prev, {
+          id: Date.now(),
+          text: data.detail,
+          sender: 'bot',
+          timestamp: new Date(),
+          final: true
+        }])
+        return
+      }
+
       if (!response.ok) {
         throw new Error('Failed to download sanction letter')
       }
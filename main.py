@@ -11,15 +11,22 @@ from fastapi.responses import FileResponse, JSONResponse
 from contextlib import asynccontextmanager
 import uvicorn
 import os
+import queue
 import logging
+import logging.handlers
 import asyncio
 from datetime import datetime, timezone
 
-# Configure logging
+# Configure logging: records are handed to a queue and written to stderr by a listener
+# thread, so logging from request handlers never blocks on the stream
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = logging.handlers.QueueListener(queue.SimpleQueue(), _log_stream)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    handlers=[logging.handlers.QueueHandler(log_listener.queue)]
 )
+log_listener.start()
 logger = logging.getLogger(__name__)
 
 from app.database.database import init_db
@@ -30,6 +37,7 @@ from app.api.dashboard import router as dashboard_router
 from app.api.ocr import router as ocr_router
 from app.models.schemas import ChatMessage, ChatResponse
 from app.agents.master_agent import MasterAgent
+from app.utils.ai_helper import ai_helper, semantic_cache
 
 
 @asynccontextmanager
@@ -48,6 +56,10 @@ async def lifespan(app: FastAPI):
     # Initialize master agent
     app.state.master_agent = MasterAgent()
     
+    # Load the intent cache's embedding model now, off the loop, instead of on the first chat
+    if ai_helper.use_ai:
+        await asyncio.to_thread(semantic_cache.load_model)
+    
     # Start background cleanup task
     cleanup_task = asyncio.create_task(periodic_cleanup(app.state.master_agent))
     
@@ -63,8 +75,14 @@ async def lifespan(app: FastAPI):
     except asyncio.CancelledError:
         pass
     
+    # Write any chat sessions still waiting for the batched flush
+    await app.state.master_agent.shutdown_flush()
+    
     logger.info("👋 Shutting down...")
     print("👋 Shutting down...")
+    
+    # Write out anything still queued for the log sink
+    log_listener.stop()
 
 
 async def periodic_cleanup(master_agent):
@@ -115,11 +133,17 @@ async def download_sanction_letter(session_id: str):
     """Download sanction letter PDF for a session"""
     import glob
     
+    # The chat turn returns before the PDF is written, so wait for a render still in flight
+    failure = await app.state.master_agent.wait_for_sanction_letter(session_id)
+    
     # Find PDF file for this session
     pattern = f"generated/sanction_letter_{session_id[:8]}*.pdf"
     files = glob.glob(pattern)
     
     if not files:
+        if failure is not None:
+            # The loan stands; tell the customer the letter will follow by email
+            raise HTTPException(status_code=503, detail=failure)
         raise HTTPException(status_code=404, detail="Sanction letter not found")
     
     # Get the most recent file if multiple exist
@@ -0,0 +1,83 @@
+"""
+Sanction letter rendering failures must still reach the customer
+"""
+import asyncio
+
+from app.agents.master_agent import MasterAgent
+from app.models.schemas import ChatStage, ConversationContext, UnderwritingResult
+
+
+class FailingPDFService:
+    """PDF service whose renderer always crashes"""
+
+    async def generate_sanction_letter(self, **kwargs):
+        raise RuntimeError("renderer crashed")
+
+
+def _decision_context() -> ConversationContext:
+    return ConversationContext(
+        session_id="abcd1234-5678-90ef",
+        customer_data={"name": "Asha"},
+        underwriting_result=UnderwritingResult(
+            approved=True,
+            loan_amount=500000,
+            emi=16607,
+            interest_rate=12.5,
+            tenure=36,
+            reason="Within pre-approved limit"
+        ),
+        current_stage=ChatStage.DECISION
+    )
+
+
+def test_failed_sanction_letter_is_reported_to_the_customer():
+    async def scenario():
+        agent = MasterAgent()
+        agent.pdf_service = FailingPDFService()
+        saved = []
+
+        async def save_session(context):
+            saved.append(context.session_id)
+
+        # Keep the test off the database
+        agent._save_session = save_session
+
+        context = _decision_context()
+        confirmation = await agent._handle_decision_stage("yes, send the sanction letter", context)
+        download = await agent.wait_for_sanction_letter(context.session_id)
+        follow_up = await agent._handle_completed_stage("hello?", context)
+        later = await agent._handle_completed_stage("thanks", context)
+        return context, saved, confirmation, download, follow_up, later
+
+    context, saved, confirmation, download, follow_up, later = asyncio.run(scenario())
+
+    assert confirmation.stage == ChatStage.COMPLETED
+    assert confirmation.metadata["sanction_letter_url"] == f"/api/download-sanction-letter/{context.session_id}"
+
+    # The download endpoint gets the apology and loan reference instead of a bare 404
+    assert download is not None
+    assert "still approved" in download
+    assert "QLABCD1234" in download
+
+    # The failure was stored on the session, and the next turn reports it once
+    assert saved == [context.session_id]
+    assert follow_up.message == download
+    assert "QLABCD1234" not in later.message
+
+
+def test_successful_sanction_letter_has_no_failure():
+    class PDFService:
+        async def generate_sanction_letter(self, **kwargs):
+            return "generated/sanction_letter_abcd1234.pdf"
+
+    async def scenario():
+        agent = MasterAgent()
+        agent.pdf_service = PDFService()
+        context = _decision_context()
+        await agent._handle_decision_stage("yes", context)
+        return context, await agent.wait_for_sanction_letter(context.session_id)
+
+    context, download = asyncio.run(scenario())
+
+    assert download is None
+    assert "sanction_letter_failed" not in context.metadata